@@ -1,8 +1,10 @@
-from flask import Flask, jsonify, request, g, make_response, Blueprint
+from flask import Flask, jsonify, request, g, make_response, send_file, Blueprint
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+from functools import wraps
 from dotenv import load_dotenv
 from os import getenv, _exit
-from os.path import exists
+from os.path import abspath, exists
 
 import src.managers as managers
 import src.families as families
@@ -10,7 +12,12 @@ import src.month as month
 import src.report as report
 import src.drivers as drivers
 import src.holiday as holiday
+import src.jobs as jobs
+import src.pdf_fonts as pdf_fonts
+import src.records as records
 
+from src.cache import files_cache
+from src.errors import InvalidArgumentError
 from src.results import get_result, Result
 
 index_filename = "index.html"
@@ -30,8 +37,21 @@ if not is_development_mode:
 
 client_address = "http://localhost:3000" if is_development_mode else f"http://{CLIENT_ADDRESS}"
 
+pdf_fonts.register_fonts()
+
+class JSONProvider(DefaultJSONProvider):
+    '''
+    Serializes search records like the dicts they replace.
+    '''
+    @staticmethod
+    def default(o):
+        if isinstance(o, records.Record):
+            return records.to_json_value(o)
+        return DefaultJSONProvider.default(o)
+
 api_blueprint = Blueprint('api', __name__, url_prefix="/api")
 app = Flask(__name__)
+app.json = JSONProvider(app)
 cors = CORS(app, resources={r"/*": {"origins": client_address}})
 
 if not is_development_mode:
@@ -71,65 +91,151 @@ def error_response(error: Exception):
 def boolean_arg(arg):
     return arg and arg.lower() == 'true'
 
-@api_blueprint.before_request
-def load_files():
-    error, families_file = families.load_families_file()
-    if error is not None:
-        return error_response(error)
-    g.families_file = families_file
-
-    error, families_history_file = families.load_families_history_file()
-    if error is not None:
-        return error_response(error)
-    g.families_history_file = families_history_file
-    
-    error, managers_file = managers.load_managers_file()
-    if error is not None:
-        return error_response(error)
-    g.managers_file = managers_file
+def int_arg(name):
+    '''
+    Returns (error, value) of an integer query arg. value is None if the arg isn't given.
+    '''
+    arg = request.args.get(name)
+    if arg is None:
+        return None, None
+    try:
+        return None, int(arg)
+    except ValueError:
+        return InvalidArgumentError(f"הפרמטר {name} חייב להיות מספר שלם"), None
+
+def get_page_args():
+    '''
+    Returns (error, args) of the pagination query args: limit, cursor and whether to count total results.
+    A limit must be positive, as a page can't hold less than a single result.
+    '''
+    error, limit = int_arg('limit')
+    if error is not None:
+        return error, None
+    if limit is not None and limit <= 0:
+        return InvalidArgumentError("מספר התוצאות בעמוד חייב להיות חיובי"), None
+
+    error, cursor = int_arg('cursor')
+    if error is not None:
+        return error, None
+
+    return None, {
+        "limit": limit,
+        "cursor": cursor,
+        "with_total": boolean_arg(request.args.get('total')),
+    }
+
+def get_fields_arg(file):
+    '''
+    Returns (error, fields) of the requested result fields, given as comma separated fields query arg.
+    fields is None if all fields are requested. Fields must be headers of the given file.
+    '''
+    fields = request.args.get('fields')
+    if not fields:
+        return None, None
+
+    fields = fields.split(',')
+    headers = file.get_headers()
+    unknown_fields = [field for field in fields if field not in headers]
+    if len(unknown_fields) > 0:
+        return InvalidArgumentError(f"השדות {', '.join(unknown_fields)} לא קיימים"), None
+    return None, fields
+
+file_loaders = {
+    "families_file": lambda read_only: families.load_families_file(read_only=read_only),
+    "families_history_file": lambda read_only: families.load_families_history_file(read_only),
+    "holiday_families_file": lambda read_only: families.load_holiday_families_file(read_only=read_only),
+    "managers_file": lambda _: managers.load_managers_file(),
+}
+
+def uses_files(*names, read_only=False):
+    '''
+    Declares the files a route works with. Only the declared files are loaded
+    into g before the route runs, so routes don't pay for files they never use.
+    Routes which only query the files should set read_only to True. Otherwise, the
+    loaded files are locked for the whole request, as they are shared between requests.
+    '''
+    def decorator(route):
+        @wraps(route)
+        def load_files(*args, **kwargs):
+            for name in names:
+                error, file = file_loaders[name](read_only)
+                if error is not None:
+                    return error_response(error)
+                setattr(g, name, file)
+            return route(*args, **kwargs)
+        return load_files
+    return decorator
+
+@app.teardown_request
+def release_files(_):
+    '''
+    Releases the locks of the writable files loaded by the request.
+    '''
+    files_cache.release_held()
 
 # Families
 
 @api_blueprint.route('/familiesCount')
+@uses_files("families_file", read_only=True)
 def families_count():
     count = families.get_count(g.families_file)
     return jsonify(familiesCount=count), 200
 
 @api_blueprint.route('/families')
+@uses_files("families_file", read_only=True)
 def query_families():
     query = request.args.get('query')
     search_by = request.args.get('by')
-    query_result = families.search_families(g.families_file, query, search_by)
-    return jsonify(families=query_result), 200
+    error, page_args = get_page_args()
+    if error is not None:
+        return error_response(error)
+    error, fields = get_fields_arg(g.families_file)
+    if error is not None:
+        return error_response(error)
+    page = families.search_families_page(g.families_file, query, search_by, **page_args, fields=fields)
+    return jsonify(families=page.results, next_cursor=page.next_cursor, total=page.total), 200
 
 @api_blueprint.route('/families/history')
+@uses_files("families_history_file", read_only=True)
 def query_families_history():
     query = request.args.get('query')
     search_by = request.args.get('by')    
-    query_result = families.search_families(g.families_history_file, query, search_by)
-    return jsonify(families=query_result), 200
-
-@api_blueprint.route('/families/holiday')
-def query_holiday_families():
-    error, holiday_families_file = families.load_holiday_families_file()
+    error, page_args = get_page_args()
     if error is not None:
         return error_response(error)
+    error, fields = get_fields_arg(g.families_history_file)
+    if error is not None:
+        return error_response(error)
+    page = families.search_families_page(g.families_history_file, query, search_by, **page_args, fields=fields)
+    return jsonify(families=page.results, next_cursor=page.next_cursor, total=page.total), 200
 
+@api_blueprint.route('/families/holiday')
+@uses_files("holiday_families_file", read_only=True)
+def query_holiday_families():
     query = request.args.get('query')
     search_by = request.args.get('by')
-    query_result = families.search_families(holiday_families_file, query, search_by)
-    return jsonify(families=query_result), 200
+    error, page_args = get_page_args()
+    if error is not None:
+        return error_response(error)
+    error, fields = get_fields_arg(g.holiday_families_file)
+    if error is not None:
+        return error_response(error)
+    page = families.search_families_page(g.holiday_families_file, query, search_by, **page_args, fields=fields)
+    return jsonify(families=page.results, next_cursor=page.next_cursor, total=page.total), 200
 
 @api_blueprint.route('/families', methods=["POST"])
+@uses_files("families_file")
 def add_families():
     req_families = request.json['families']
     month_insert = request.json['month_insert']
-    result = families.add_families(g.families_file, req_families)
-    if result.status == 200 and month_insert:
-        month.insert_families_to_active(req_families)
-    return jsonify(title=result.title, description=result.description, family_name=result.family_key), result.status
+    result, added_families = families.add_families(g.families_file, req_families)
+    if month_insert and len(added_families) > 0:
+        month.insert_families_to_active(added_families)
+    errors = [{ "title": e.title, "description": e.description, "family_name": e.family_key } for e in result.errors]
+    return jsonify(title=result.title, description=result.description, family_name=result.family_key, errors=errors), result.status
 
 @api_blueprint.route('/family', methods=["PUT"])
+@uses_files("families_file")
 def update_family():
     original_name = request.json['original_name']
     family_data = request.json['family_data']
@@ -139,19 +245,17 @@ def update_family():
     return jsonify(), 200
 
 @api_blueprint.route('/holiday/family', methods=["PUT"])
+@uses_files("holiday_families_file")
 def update_holiday_family():
-    error, holiday_families_file = families.load_holiday_families_file()
-    if error is not None:
-        return error_response(error)
-
     original_name = request.json['original_name']
     family_data = request.json['family_data']
-    error = families.update_family(holiday_families_file, original_name, family_data)
+    error = families.update_family(g.holiday_families_file, original_name, family_data)
     if error is not None:
         return error_response(error)
     return jsonify(), 200
 
 @api_blueprint.route('/family/remove', methods=["DELETE"])
+@uses_files("families_file", "families_history_file")
 def remove_family():
     family_name = request.args.get('family_name')
     remove_from = request.args.get('from')
@@ -181,6 +285,7 @@ def remove_family():
     return jsonify(), 200
 
 @api_blueprint.route('/family/restore', methods=["POST"])
+@uses_files("families_file", "families_history_file")
 def restore_family():
     family_name = request.json['family_name']
     error = families.restore_family(g.families_file, g.families_history_file, family_name)
@@ -189,6 +294,7 @@ def restore_family():
     return jsonify(), 200
 
 @api_blueprint.route('/family/remove/permanent', methods=["DELETE"])
+@uses_files("families_history_file")
 def permanent_remove_family():
     family_name = request.args.get('family_name')
     error = families.permanent_remove_family(g.families_history_file, family_name)
@@ -197,12 +303,14 @@ def permanent_remove_family():
     return jsonify(), 200
 
 @api_blueprint.route('/family/driver/remove', methods=["DELETE"])
+@uses_files("families_file")
 def remove_family_driver():
     family_name = request.args.get('family_name')
     families.remove_driver(g.families_file, family_name)
     return jsonify(), 200
 
 @api_blueprint.route('/family/driver/add', methods=["POST"])
+@uses_files("families_file")
 def add_family_driver():
     family_name = request.json['family_name']
     driver_name = request.json['driver_name']
@@ -222,11 +330,13 @@ def get_family_receipt_history():
 # Managers
 
 @api_blueprint.route('/managers')
+@uses_files("managers_file")
 def get_managers():
     response_managers = managers.get_managers(g.managers_file)
     return jsonify(managers=response_managers), 200
 
 @api_blueprint.route('/managers', methods=["POST"])
+@uses_files("families_file", "managers_file")
 def update_managers():
     request_managers = request.json['managers']
     removed_drivers = managers.get_drivers_diff(g.managers_file, request_managers)
@@ -237,6 +347,7 @@ def update_managers():
     return jsonify(), 200
 
 @api_blueprint.route('/managers/remove', methods=["DELETE"])
+@uses_files("managers_file")
 def remove_manager():
     manager_id = request.args.get('manager_id')
     error = managers.remove_manager(g.managers_file, manager_id)
@@ -245,6 +356,7 @@ def remove_manager():
     return jsonify(), 200
 
 @api_blueprint.route('/managers/add', methods=["POST"])
+@uses_files("managers_file")
 def add_manager():
     manager_name = request.json['manager_name']
     error = managers.add_manager(g.managers_file, manager_name)
@@ -253,6 +365,7 @@ def add_manager():
     return jsonify(), 200
 
 @api_blueprint.route('/managers/print', methods=["PUT"])
+@uses_files("managers_file")
 def update_manager_print_status():
     manager_name = request.json['manager_name']
     print_status = request.json['print_status']
@@ -260,6 +373,7 @@ def update_manager_print_status():
     return jsonify(), 200
 
 @api_blueprint.route('/validate/drivers')
+@uses_files("families_file", "managers_file", read_only=True)
 def validate_drivers():
     error, no_manager_drivers = report.get_no_manager_drivers(g.families_file, g.managers_file)
     if error is not None:
@@ -274,6 +388,7 @@ def validate_drivers():
 # Month and report
 
 @api_blueprint.route('/generate/month', methods=["POST"])
+@uses_files("families_file", read_only=True)
 def generate_month():
     name = request.json['name']
     override_name = request.json['override_name']
@@ -295,12 +410,18 @@ def query_report():
     query = request.args.get('query')
     search_by = request.args.get('by')
 
-    error, report_file = month.load_month_report(report_name)
+    error, page_args = get_page_args()
+    if error is not None:
+        return error_response(error)
+    error, report_file = month.load_month_report(report_name, read_only=True)
+    if error is not None:
+        return error_response(error)
+    error, fields = get_fields_arg(report_file)
     if error is not None:
         return error_response(error)
     
-    query_result = report.search_report(report_file, query, search_by)
-    return jsonify(report=query_result), 200
+    page = report.search_report_page(report_file, query, search_by, **page_args, fields=fields)
+    return jsonify(report=page.results, next_cursor=page.next_cursor, total=page.total), 200
 
 @api_blueprint.route('/report/column')
 def query_report_column():
@@ -308,7 +429,7 @@ def query_report_column():
     query = request.args.get('query')
     search_by = request.args.get('by')
 
-    error, report_file = month.load_month_report(report_name)
+    error, report_file = month.load_month_report(report_name, read_only=True)
     if error is not None:
         return error_response(error)
     
@@ -351,7 +472,7 @@ def get_family_receipt_status():
     report_name = request.args.get('report_name')
     name = request.args.get('name')
 
-    error, report_file = month.load_month_report(report_name)
+    error, report_file = month.load_month_report(report_name, read_only=True)
     if error is not None:
         return error_response(error)
     
@@ -363,7 +484,7 @@ def get_driver_receipt_status():
     report_name = request.args.get('report_name')
     name = request.args.get('name')
 
-    error, report_file = month.load_month_report(report_name)
+    error, report_file = month.load_month_report(report_name, read_only=True)
     if error is not None:
         return error_response(error)
     
@@ -371,10 +492,11 @@ def get_driver_receipt_status():
     return jsonify(status=status)
 
 @api_blueprint.route('/report/completion')
+@uses_files("families_file", read_only=True)
 def get_completions():
     report_name = request.args.get('report_name')
 
-    error, report_file = month.load_month_report(report_name)
+    error, report_file = month.load_month_report(report_name, read_only=True)
     if error is not None:
         return error_response(error)
     
@@ -382,10 +504,16 @@ def get_completions():
     return jsonify(families=families)
 
 @api_blueprint.route('/report/completion/build', methods=["POST"])
+@uses_files("families_file", read_only=True)
 def build_completion_page():
     month_name = request.json['month_name']
     title = request.json['title']
     families = request.json['families']
+    if boolean_arg(request.args.get('stream')):
+        save = request.json.get('save', False)
+        printable = month.render_completion_pdf(month_name, title, g.families_file, families, save)
+        return get_printable_response(printable, None)
+
     month.generate_completion_pdf(month_name, title, g.families_file, families)
     return jsonify(), 200
 
@@ -413,6 +541,11 @@ def generate_general_printable():
     holiday_name = request.json['holiday_name']
     title = request.json['title']
     content = request.json['content']
+    if boolean_arg(request.args.get('stream')):
+        save = request.json.get('save', False)
+        printable = holiday.render_holiday_custom_pdf(holiday_name, title, content, save)
+        return get_printable_response(printable, None)
+
     holiday.generate_holiday_custom_pdf(holiday_name, title, content)
     return jsonify(), 200
 
@@ -427,21 +560,34 @@ def get_printable_response(printable, error):
     response.headers['Content-Disposition'] = 'inline'
     return response
 
+def get_printable_file_response(printable_path, error):
+    '''
+    Streams the printable file, answering conditional and range requests.
+    '''
+    if error is not None:
+        return error_response(error)
+    if printable_path is None:
+        return jsonify(), 200
+
+    response = send_file(abspath(printable_path), mimetype='application/pdf', conditional=True, etag=True, max_age=0)
+    response.headers['Content-Disposition'] = 'inline'
+    return response
+
 @api_blueprint.route('/print/month')
 def get_month_printable_report():
     report_name = request.args.get('report_name')
     printable = request.args.get('printable')
 
-    printable, error = month.get_printable_report(report_name, printable)
-    return get_printable_response(printable, error)
+    printable_path, error = month.get_printable_report(report_name, printable)
+    return get_printable_file_response(printable_path, error)
 
 @api_blueprint.route('/print/holiday')
 def get_holiday_printable():
     holiday_name = request.args.get('holiday_name')
     printable = request.args.get('printable')
 
-    printable, error = holiday.get_holiday_printable(holiday_name, printable)
-    return get_printable_response(printable, error)
+    printable_path, error = holiday.get_holiday_printable(holiday_name, printable)
+    return get_printable_file_response(printable_path, error)
 
 @api_blueprint.route('/print/month/all')
 def get_month_printable_files():
@@ -458,17 +604,20 @@ def get_holiday_printable_files():
 # Drivers
 
 @api_blueprint.route('/drivers')
+@uses_files("families_file", "managers_file", read_only=True)
 def get_drivers():
     app_drivers = drivers.get_drivers(g.families_file, g.managers_file)
     return jsonify(drivers=app_drivers), 200
 
 @api_blueprint.route('/drivers/families')
+@uses_files("families_file", read_only=True)
 def get_driver_families():
     driver_name = request.args.get('driver_name')
     families = drivers.get_driver_families(g.families_file, driver_name)
     return jsonify(families=families), 200
 
 @api_blueprint.route('/drivers/update', methods=["PUT"])
+@uses_files("families_file", "managers_file")
 def update_driver_name():
     original = request.json['original']
     updated = request.json['updated']
@@ -479,11 +628,13 @@ def update_driver_name():
     return jsonify(), 200
 
 @api_blueprint.route('/drivers/driverless')
+@uses_files("families_file", read_only=True)
 def get_driverless_families():
     families = drivers.get_driverless_families(g.families_file)
     return jsonify(families=families), 200
 
 @api_blueprint.route('/drivers/print', methods=["PUT"])
+@uses_files("managers_file")
 def update_driver_print_status():
     driver_name = request.json['driver_name']
     print_status = request.json['print_status']
@@ -493,6 +644,7 @@ def update_driver_print_status():
 # Holidays
 
 @api_blueprint.route('/holiday/new', methods=["POST"])
+@uses_files("families_file")
 def generate_holiday():
     holiday_name = request.json['holiday_name']
     holiday.initialize_holiday(g.families_file, holiday_name)
@@ -512,26 +664,20 @@ def get_holiday_regular_families():
     return jsonify(families=families), 200
 
 @api_blueprint.route('holiday/status')
+@uses_files("holiday_families_file", read_only=True)
 def get_holiday_families_selection():
-    error, holiday_families_file = families.load_holiday_families_file()
-    if error is not None:
-        return error_response(error)
-
     holiday_name = request.args.get('holiday_name')
-    error, status = holiday.get_holiday_families_status(holiday_families_file, holiday_name)
+    error, status = holiday.get_holiday_families_status(g.holiday_families_file, holiday_name)
     if error is not None:
         return error_response(error)
     return jsonify(status=status), 200
 
 @api_blueprint.route('holiday/status/update', methods=["PUT"])
+@uses_files("holiday_families_file")
 def update_holiday_families_selection():
-    error, holiday_families_file = families.load_holiday_families_file()
-    if error is not None:
-        return error_response(error)
-
     holiday_name = request.json['holiday_name']
     holiday_families = request.json['holiday_families']
-    error, result = holiday.update_holiday_families_status(holiday_families_file, holiday_name, holiday_families)
+    error, result = holiday.update_holiday_families_status(g.holiday_families_file, holiday_name, holiday_families)
     if error is not None:
         return error_response(error)
 
@@ -540,6 +686,7 @@ def update_holiday_families_selection():
     return jsonify(), 200
 
 @api_blueprint.route('holiday/drivers')
+@uses_files("managers_file")
 def get_holiday_drivers_status():
     holiday_name = request.args.get('holiday_name')
     error, drivers = holiday.get_holiday_drivers(g.managers_file, holiday_name)
@@ -584,33 +731,62 @@ def add_holiday_family_driver():
     return jsonify(), 200
 
 @api_blueprint.route('/holiday/generate/printable', methods=["POST"])
+@uses_files("managers_file")
 def generate_holiday_printable():
     holiday_name = request.json['holiday_name']
     holiday.generate_holiday_main_pdf(holiday_name, g.managers_file)
     return jsonify(), 200
 
 @api_blueprint.route('/holiday/move/regular', methods=["POST"])
+@uses_files("families_file", "holiday_families_file")
 def move_holiday_family_to_regular():
-    error, holiday_families_file = families.load_holiday_families_file()
-    if error is not None:
-        return error_response(error)
-
     family_name = request.json['family_name']
-    error = families.move_holiday_to_regular(g.families_file, holiday_families_file, family_name)
+    error = families.move_holiday_to_regular(g.families_file, g.holiday_families_file, family_name)
     if error is not None:
         return error_response(error)
     return jsonify(), 200
 
 @api_blueprint.route('/families/move/holiday', methods=["POST"])
+@uses_files("families_file", "holiday_families_file")
 def move_regular_family_to_holiday():
-    error, holiday_families_file = families.load_holiday_families_file()
+    family_name = request.json['family_name']
+    error = families.move_regular_to_holiday(g.families_file, g.holiday_families_file, family_name)
     if error is not None:
         return error_response(error)
+    return jsonify(), 200 
 
-    family_name = request.json['family_name']
-    error = families.move_regular_to_holiday(g.families_file, holiday_families_file, family_name)
+# Jobs
+
+def generate_month_job(name, override_name, on_progress):
+    error, families_file = families.load_families_file(read_only=True)
+    if error is not None:
+        return error
+    return month.generate_month_files(families_file, name, override_name, on_progress)
+
+def generate_holiday_printable_job(holiday_name, on_progress):
+    error, managers_file = managers.load_managers_file()
+    if error is not None:
+        return error
+    return holiday.generate_holiday_main_pdf(holiday_name, managers_file, on_progress)
+
+@api_blueprint.route('/jobs/generate/month', methods=["POST"])
+def submit_generate_month():
+    name = request.json['name']
+    override_name = request.json['override_name']
+    job_id = jobs.jobs_queue.submit("generate_month", generate_month_job, name, override_name)
+    return jsonify(job_id=job_id), 202
+
+@api_blueprint.route('/jobs/holiday/generate/printable', methods=["POST"])
+def submit_generate_holiday_printable():
+    holiday_name = request.json['holiday_name']
+    job_id = jobs.jobs_queue.submit("generate_holiday_printable", generate_holiday_printable_job, holiday_name)
+    return jsonify(job_id=job_id), 202
+
+@api_blueprint.route('/jobs/<job_id>')
+def get_job(job_id):
+    error, job = jobs.jobs_queue.get(job_id)
     if error is not None:
         return error_response(error)
-    return jsonify(), 200 
+    return jsonify(job=job), 200
 
 app.register_blueprint(api_blueprint)
@@ -0,0 +1,92 @@
+from os import stat
+from threading import Lock, RLock, local
+
+def get_file_stamp(filename):
+    '''
+    Returns a value which changes whenever the given file is modified.
+    '''
+    info = stat(filename)
+    return (info.st_ino, info.st_mtime_ns, info.st_size)
+
+class FilesCache():
+    '''
+    Process-wide cache of loaded files, shared between requests.
+    A cached item is valid as long as its source file stamp is unchanged.
+
+    Writable items are shared between threads too, so whoever loads an item to change it
+    should hold the file lock with hold(), until it is done using the item.
+    '''
+    def __init__(self):
+        self.lock = Lock()
+        self.entries = {}
+        self.file_locks = {}
+        self.held = local()
+
+    def get(self, filename, loader, key=None):
+        '''
+        Returns the cached item of filename, or loads it using loader if the
+        cached item is missing or stale. key defaults to filename, and should be
+        used when the same file may be loaded in different ways.
+        '''
+        key = filename if key is None else key
+        try:
+            stamp = get_file_stamp(filename)
+        except OSError:
+            return loader() # Let the loader report missing files
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry["stamp"] == stamp:
+                return entry["item"]
+
+        item = loader()
+        with self.lock:
+            self.entries[key] = { "filename": filename, "stamp": stamp, "item": item }
+        return item
+
+    def hold(self, filename):
+        '''
+        Acquires the lock of filename for the current thread, until it calls release_held().
+        A thread may hold the same file more than once.
+        '''
+        with self.lock:
+            file_lock = self.file_locks.setdefault(filename, RLock())
+        file_lock.acquire()
+        if not hasattr(self.held, "locks"):
+            self.held.locks = []
+        self.held.locks.append((filename, file_lock))
+
+    def release(self, filename):
+        '''
+        Releases the lock of filename, as many times as the current thread holds it.
+        Should be used by threads which are done changing a file long before they call release_held().
+        '''
+        locks = getattr(self.held, "locks", [])
+        self.held.locks = [(held_filename, file_lock) for held_filename, file_lock in locks if held_filename != filename]
+        for held_filename, file_lock in locks:
+            if held_filename == filename:
+                file_lock.release()
+
+    def release_held(self):
+        '''
+        Releases all file locks held by the current thread.
+        '''
+        locks = getattr(self.held, "locks", [])
+        while locks:
+            _, file_lock = locks.pop()
+            file_lock.release()
+
+    def invalidate(self, filename):
+        '''
+        Drops all cached items loaded from filename.
+        '''
+        with self.lock:
+            for key, entry in list(self.entries.items()):
+                if entry["filename"] == filename:
+                    del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+files_cache = FilesCache()
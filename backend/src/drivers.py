@@ -73,8 +73,9 @@ def update_driver_name(families_file: Excel, managers_file: Json, original, upda
         return result
     
     update_manager_driver(managers_file, original, updated)
-    for family in get_driver_families(families_file, original):
-        update_driver(families_file, family[key_prop], updated)
+    with families_file.batch():
+        for family in get_driver_families(families_file, original):
+            update_driver(families_file, family[key_prop], updated)
 
     return driver_update_results["DRIVER_UPDATED"]
 
@@ -27,3 +27,18 @@ class ActiveReportNotFound(Exception):
     def __init__(self, description):
         super().__init__()
         self.result = Result(404, "Active Report Not Found", description)
+
+class ReadOnlyFileError(Exception):
+    def __init__(self, description):
+        super().__init__()
+        self.result = Result(500, "Read Only File", description)
+
+class JobNotFoundError(Exception):
+    def __init__(self, description):
+        super().__init__()
+        self.result = Result(404, "Job Not Found", description)
+
+class InvalidArgumentError(Exception):
+    def __init__(self, description):
+        super().__init__()
+        self.result = Result(400, "Invalid Argument", description)
@@ -1,21 +1,41 @@
+from bisect import bisect_right
+from contextlib import contextmanager
 from openpyxl import load_workbook
 from openpyxl.packaging.custom import BoolProperty
-from os import path
-
-from src.search import SearchRequest, search, StyleSearchRequest, style_search, ColumnSearchRequest, search_column, FindRequest, find
-from src.errors import FileResourcesMissingError, FamilyNotFoundError
-from src.util import letter_by_index
+from os import path, remove, replace
+
+from src.cache import files_cache
+from src.search import is_phone_search, SearchRequest, search, get_matching_rows, StyleSearchRequest, style_search, get_style_matching_rows, ColumnSearchRequest, search_column, SearchPage, RowsCursor
+from src.errors import FileResourcesMissingError, FamilyNotFoundError, ReadOnlyFileError
+from src.index import ColumnIndex
+from src.table import build_table
+from src.util import letter_by_index, generate_random_id
+from src.xlsx import read_xlsx_file
 from src.styles import NamedStyle
 
 class Excel:
+    '''
+    Wraps a single-sheet excel file.
+
+    If read_only is True, the file is parsed by the xlsx reader, which loads much faster
+    and uses less memory than openpyxl and keeps its parsed sheet in a sidecar file,
+    but any attempt to modify the file is refused.
+    '''
     def __init__(self, filename: str, row_properties, search_enum,
-                 required_style: NamedStyle, table_name: str = ""):
+                 required_style: NamedStyle, table_name: str = "", read_only=False):
         if not path.exists(filename):
             raise FileNotFoundError(f'הקובץ {filename} לא נמצא')
 
         self.filename = filename
-        self.workbook = load_workbook(filename)
-        self.worksheet = self.workbook[self.workbook.sheetnames[0]]
+        self.read_only = read_only
+        self.batch_depth = 0
+        self.has_unsaved_changes = False
+        if read_only:
+            self.workbook = None
+            self.worksheet = read_xlsx_file(filename)
+        else:
+            self.workbook = load_workbook(filename)
+            self.worksheet = self.workbook[self.workbook.sheetnames[0]]
 
         self.table_name = table_name
         self.cell_style = required_style.name
@@ -24,6 +44,13 @@ class Excel:
         self.search_enum = search_enum
         self.last_column = letter_by_index(len(row_properties))
         self.first_content_row = 2 # First row is 1, and contains titles
+        self.key_column = search_enum.get_search_columns('name')[0]
+        self.indexes = {}
+        self.loaded_rows = None
+        self.columns_table = None
+
+        if read_only:
+            return # Styles and tables are only required for writing
 
         self.add_named_style(required_style)
 
@@ -31,10 +58,53 @@ class Excel:
             raise FileResourcesMissingError(
                 f"על הקובץ {filename} להכיל טבלה בשם '{self.table_name}'")
 
+    def ensure_writable(self):
+        if self.read_only:
+            raise ReadOnlyFileError(f"הקובץ {self.filename} נפתח לקריאה בלבד")
+
     def save(self):
-        self.workbook.save(self.filename)
+        '''
+        Saves the workbook to its file. Inside a batch, saving is deferred to the end of the batch.
+
+        The workbook is saved to a temporary file which then replaces the file at once,
+        since read-only loads don't wait for writers, and mustn't read a partially saved file.
+        '''
+        self.ensure_writable()
+        if self.batch_depth > 0:
+            self.has_unsaved_changes = True
+            return
+
+        temp_filename = f"{self.filename}.{generate_random_id()}.tmp"
+        try:
+            self.workbook.save(temp_filename)
+            replace(temp_filename, self.filename)
+        finally:
+            if path.exists(temp_filename):
+                remove(temp_filename)
+            # Changes are read again from the saved file, which may differ from this object
+            # (empty strings are saved as empty cells). If saving failed, this object holds
+            # changes the file doesn't, so it mustn't be reused either.
+            files_cache.invalidate(self.filename)
+        self.has_unsaved_changes = False
+
+    @contextmanager
+    def batch(self):
+        '''
+        Groups all changes made inside the with block into a single save, which
+        happens when the block exits. Nested batches are saved by the outermost batch.
+        Changes are saved even if the block raises, same as they would be without a batch.
+        '''
+        self.ensure_writable()
+        self.batch_depth += 1
+        try:
+            yield self
+        finally:
+            self.batch_depth -= 1
+            if self.batch_depth == 0 and self.has_unsaved_changes:
+                self.save()
     
     def duplicate(self, new_path):
+        self.ensure_writable()
         self.workbook.save(new_path)
 
     def get_rows_num(self):
@@ -47,31 +117,110 @@ class Excel:
     def get_rows_iter(self):
         return self.worksheet.iter_rows(min_row=self.first_content_row)
 
-    def get_row_index(self, row_key):
-        request = FindRequest(
-            rows_iter=self.get_rows_iter(),
-            query=row_key,
-            search_enum=self.search_enum
-        )
+    def get_index(self, column):
+        '''
+        Returns the index of the given column, builds it on first use.
+        '''
+        if column not in self.indexes:
+            table = self.get_columns_table()
+            self.indexes[column] = ColumnIndex(column).build(table.columns[column], table.row_indexes)
+        return self.indexes[column]
+
+    def get_columns_table(self):
+        '''
+        Returns a columnar snapshot of the sheet values, built on first use after each change.
+        '''
+        if self.columns_table is None:
+            rows_values = self.worksheet.iter_rows(min_row=self.first_content_row, values_only=True)
+            headers = self.get_headers()
+            columns_num = max(len(self.row_properties), len(headers))
+            self.columns_table = build_table(headers, rows_values, self.first_content_row, columns_num)
+        return self.columns_table
+
+    def load_rows(self):
+        '''
+        Read-only files can't access rows by index, so indexed rows are loaded into memory once.
+        '''
+        if self.loaded_rows is None:
+            self.loaded_rows = list(self.get_rows_iter())
+        return self.loaded_rows
+
+    def get_row(self, row_index):
+        '''
+        Returns the row of the given row index.
+        '''
+        if self.read_only:
+            return self.load_rows()[row_index - self.first_content_row]
+        return self.worksheet[row_index]
+
+    def get_search_row_indexes(self, query, search_by='', empty=False, exact=False):
+        '''
+        Returns the sorted indexes of rows which may match a search, found by the indexes of the searched columns.
+        Returned rows should be matched again by the search itself.
+        '''
+        row_indexes = set()
+        for column in self.search_enum.get_search_columns(search_by):
+            index = self.get_index(column)
+            if empty:
+                row_indexes.update(index.empty())
+            elif exact and not is_phone_search(self.search_enum, search_by):
+                row_indexes.update(index.exact(query))
+            else:
+                row_indexes.update(index.contains(query))
+        return sorted(row_indexes)
+
+    def get_page(self, row_indexes, to_request, search_rows, get_matching_rows, limit, cursor, with_total):
+        '''
+        (Internal) Searches the given row indexes after cursor, and stops after limit results.
+        to_request should create the search request of the given rows_iter and limit.
+        '''
+        page_row_indexes = row_indexes if cursor is None else row_indexes[bisect_right(row_indexes, cursor):]
+        rows = RowsCursor(page_row_indexes, self.get_row)
+        results = search_rows(to_request(rows, limit))
+
+        total = None
+        if with_total:
+            all_rows = RowsCursor(row_indexes, self.get_row)
+            total = sum(1 for _ in get_matching_rows(to_request(all_rows, None)))
+        return SearchPage(results, rows.get_next_cursor() if limit is not None else None, total)
 
-        result = find(request)
-        if result != -1:
-            return result + self.first_content_row
+    def has_row(self, row_key):
+        return self.get_index(self.key_column).first(row_key) is not None
+
+    def get_row_index(self, row_key):
+        row_index = self.get_index(self.key_column).first(row_key)
+        if row_index is not None:
+            return row_index
         else:
             raise FamilyNotFoundError(f"המשפחה {row_key} לא נמצאת")
 
-    def search(self, query, search_by='', empty=False, exact=False):
-        request = SearchRequest(
-            rows_iter=self.get_rows_iter(),
-            headers=self.get_headers(),
-            query=query,
-            search_by=search_by,
-            search_enum=self.search_enum,
-            empty_search=empty,
-            exact=exact
-        )
+    def search(self, query, search_by='', empty=False, exact=False, fields=None):
+        return self.search_page(query, search_by, empty, exact, fields=fields).results
 
-        return search(request)
+    def search_page(self, query, search_by='', empty=False, exact=False, limit=None, cursor=None, with_total=False, fields=None):
+        '''
+        Returns a SearchPage of the rows which match the search.
+        If limit is given, the search stops after limit results, and the page next_cursor
+        should be passed as cursor to get the following results.
+        If with_total is True, all matching rows are counted.
+        If fields are given, results contain only these headers.
+        '''
+        headers = self.get_headers()
+        def to_request(rows_iter, limit):
+            return SearchRequest(
+                rows_iter=rows_iter,
+                headers=headers,
+                query=query,
+                search_by=search_by,
+                search_enum=self.search_enum,
+                empty_search=empty,
+                exact=exact,
+                limit=limit,
+                fields=fields
+            )
+
+        row_indexes = self.get_search_row_indexes(query, search_by, empty, exact)
+        return self.get_page(row_indexes, to_request, search, get_matching_rows, limit, cursor, with_total)
 
     def style_search(
             self,
@@ -79,24 +228,47 @@ class Excel:
             search_by='',
             search_style=None,
             style_map={},
-            exact=False):
-        request = StyleSearchRequest(
-            headers=self.get_headers(),
-            query=query,
-            rows_iter=self.get_rows_iter(),
-            search_by=search_by,
-            search_enum=self.search_enum,
-            search_style=search_style,
-            style_map=style_map,
-            exact=exact
-        )
+            exact=False,
+            fields=None):
+        return self.style_search_page(query, search_by, search_style, style_map, exact, fields=fields).results
 
-        return style_search(request)
+    def style_search_page(
+            self,
+            query,
+            search_by='',
+            search_style=None,
+            style_map={},
+            exact=False,
+            limit=None,
+            cursor=None,
+            with_total=False,
+            fields=None):
+        '''
+        Returns a SearchPage of style_search() results, same as search_page().
+        '''
+        headers = self.get_headers()
+        def to_request(rows_iter, limit):
+            return StyleSearchRequest(
+                headers=headers,
+                query=query,
+                rows_iter=rows_iter,
+                search_by=search_by,
+                search_enum=self.search_enum,
+                search_style=search_style,
+                style_map=style_map,
+                exact=exact,
+                limit=limit,
+                fields=fields
+            )
+
+        row_indexes = self.get_search_row_indexes(query, search_by, exact=exact)
+        return self.get_page(row_indexes, to_request, style_search, get_style_matching_rows, limit, cursor, with_total)
 
     def column_search(self, query, search_by=''):
+        table = self.get_columns_table()
         request = ColumnSearchRequest(
             query=query,
-            rows_iter=self.get_rows_iter(),
+            rows_iter=zip(*(table.columns[column] for column in self.search_enum.get_search_columns(search_by))),
             search_by=search_by,
             search_enum=self.search_enum
         )
@@ -104,32 +276,57 @@ class Excel:
         return search_column(request)
 
     def append_rows(self, families_data):
+        '''
+        Appends all given rows after the last row in a single pass,
+        and extends the table to contain them once at the end.
+        '''
+        self.ensure_writable()
+        rows_num = last_row = self.get_rows_num()
         for family_data in families_data:
-            new_row = self.get_rows_num() + 1
-            self.worksheet.insert_rows(idx=new_row, amount=1)
-
+            last_row += 1
             for column, value in enumerate(family_data, 1):
-                cell = self.worksheet.cell(row=new_row, column=column)
-                cell.value = value
+                cell = self.worksheet.cell(row=last_row, column=column, value=value)
                 cell.style = self.cell_style
 
-            if self.table_name:
-                self.worksheet.tables[self.table_name].ref = f'A1:{self.last_column}{new_row}'
+            for column, index in self.indexes.items():
+                value = family_data[column] if column < len(family_data) else None
+                index.add(value, last_row)
+        self.columns_table = None
+
+        if self.table_name and last_row > rows_num:
+            self.worksheet.tables[self.table_name].ref = f'A1:{self.last_column}{last_row}'
 
         self.save()
 
     def remove_row(self, row_index):
+        self.ensure_writable()
+        for column, index in self.indexes.items():
+            index.remove(self.worksheet.cell(row=row_index, column=column + 1).value, row_index)
+            index.shift(row_index)
+
         self.worksheet.delete_rows(row_index)
+        self.columns_table = None
         self.save()
 
+    def set_cell_value(self, row_index, column, value):
+        '''
+        Sets value of a single cell and keeps the column index updated.
+        column starts at 0, like columns of search requests.
+        '''
+        cell = self.worksheet.cell(row=row_index, column=column + 1)
+        if (index := self.indexes.get(column)) is not None:
+            index.remove(cell.value, row_index)
+            index.add(value, row_index)
+        cell.value = value
+        self.columns_table = None
+
     def replace_row(self, row_index, row_data):
+        self.ensure_writable()
         for key, value in row_data.items():
             if key not in self.row_properties:
                 continue
 
-            col_index = self.row_properties.index(key) + 1
-            cell = self.worksheet.cell(row=row_index, column=col_index)
-            cell.value = value
+            self.set_cell_value(row_index, self.row_properties.index(key), value)
 
         self.save()
 
@@ -139,16 +336,17 @@ class Excel:
         Expects cell_data to be a dict with a "key" attr, in addition to a "style" or "value"
         attributes. If both present, "value" will be ignored.
         '''
+        self.ensure_writable()
         if cell_data["key"] not in self.row_properties:
             return
 
-        col_index = self.row_properties.index(cell_data["key"]) + 1
-        cell = self.worksheet.cell(row=row_index, column=col_index)
+        column = self.row_properties.index(cell_data["key"])
 
         if "style" in cell_data:
+            cell = self.worksheet.cell(row=row_index, column=column + 1)
             cell.style = cell_data["style"]
         elif "value" in cell_data:
-            cell.value = cell_data["value"]
+            self.set_cell_value(row_index, column, cell_data["value"])
 
         self.save()
 
@@ -162,6 +360,7 @@ class Excel:
         Creates or overrides custom document property of excel.
         * Supports boolean properties only.
         '''
+        self.ensure_writable()
         prop = BoolProperty(property, value)
         if self.get_custom_property(property) is None:
             self.workbook.custom_doc_props.append(prop)
@@ -174,6 +373,8 @@ class Excel:
         '''
         Returns value of given custom excel property.
         '''
+        if self.read_only:
+            return self.worksheet.custom_properties.get(property)
         try:
             prop = self.workbook.custom_doc_props[property]
         except:
@@ -1,9 +1,10 @@
 from enum import Enum
 
 from src.data import driver_prop, key_prop, family_properties, families_filename, families_history_filename, holiday_families_filename, history_properties, holiday_properties, exit_date_prop, reason_prop
+from src.cache import files_cache
 from src.excel import Excel
 from src.util import without_hyphen, insert_hyphen, validate_driver_name
-from src.results import Result, add_results, add_many_error, add_many_results, driver_update_results
+from src.results import Result, add_results, add_many_error, add_many_errors, add_many_results, driver_update_results
 from src.styles import families_cell_style
 
 class FamiliesSearchBy(Enum):
@@ -81,24 +82,33 @@ class HolidayFamiliesSearchBy(Enum):
             case _:
                 return [0]
 
-def load_families_excel(filename, row_properties, search_enum):
+def load_families_excel(filename, row_properties, search_enum, read_only=False):
     '''
-    Internal wrapper for loading excel files containing families
+    Internal wrapper for loading excel files containing families.
+    Loaded files are cached until they are modified. Writable files are held by the
+    loading thread, until it calls files_cache.release_held().
     '''
-    try:
-        families_file = Excel(
+    def load():
+        return Excel(
             filename=filename,
             row_properties=row_properties,
             search_enum=search_enum,
             required_style=families_cell_style,
-            table_name='נתמכים')
+            table_name='נתמכים',
+            read_only=read_only)
+
+    if not read_only:
+        files_cache.hold(filename)
+    try:
+        families_file = files_cache.get(filename, load, key=(filename, read_only))
         return (None, families_file)
     except Exception as e:
         return (e, None)
 
-def load_families_file(filepath=families_filename):
+def load_families_file(filepath=families_filename, read_only=False):
     '''
     Connects to the families source file.
+    If read_only is True, the file is opened for queries only.
 
     Returns a tuple: (error, file)
         - If connection has failed, file will be None
@@ -107,11 +117,13 @@ def load_families_file(filepath=families_filename):
     return load_families_excel(
         filepath,
         family_properties,
-        FamiliesSearchBy)
+        FamiliesSearchBy,
+        read_only)
 
-def load_families_history_file():
+def load_families_history_file(read_only=False):
     '''
     Connects to the families history source file.
+    If read_only is True, the file is opened for queries only.
 
     Returns a tuple: (error, file)
         - If connection has failed, file will be None
@@ -120,11 +132,13 @@ def load_families_history_file():
     return load_families_excel(
         families_history_filename,
         history_properties,
-        FamiliesHistorySearchBy)
+        FamiliesHistorySearchBy,
+        read_only)
 
-def load_holiday_families_file(filepath=holiday_families_filename):
+def load_holiday_families_file(filepath=holiday_families_filename, read_only=False):
     '''
     Connects to the holiday famileis source file.
+    If read_only is True, the file is opened for queries only.
 
     Returns a tuple: (error, file)
         - If connection has failed, file will be None
@@ -133,7 +147,8 @@ def load_holiday_families_file(filepath=holiday_families_filename):
     return load_families_excel(
         filepath,
         holiday_properties,
-        HolidayFamiliesSearchBy)
+        HolidayFamiliesSearchBy,
+        read_only)
 
 def to_excel_row(family):
     '''
@@ -160,16 +175,26 @@ def get_count(families_file: Excel):
     '''
     return families_file.get_rows_num() - 1
 
-def search_families(families_file: Excel, query='', search_by='', exact=False):
+def search_families(families_file: Excel, query='', search_by='', exact=False, fields=None):
     '''
     Returns list of families who their value of the search_by cell
-    matches the given query
+    matches the given query. If fields are given, families contain only these properties.
     '''
     query = '' if query is None else query
     search_by = '' if search_by is None else search_by
     exact = False if exact is None else exact
 
-    return families_file.search(query, search_by, exact=exact)
+    return families_file.search(query, search_by, exact=exact, fields=fields)
+
+def search_families_page(families_file: Excel, query='', search_by='', limit=None, cursor=None, with_total=False, fields=None):
+    '''
+    Returns a SearchPage of families who their value of the search_by cell matches the given query.
+    Up to limit families are returned, starting after cursor.
+    '''
+    query = '' if query is None else query
+    search_by = '' if search_by is None else search_by
+
+    return families_file.search_page(query, search_by, limit=limit, cursor=cursor, with_total=with_total, fields=fields)
 
 def format_phone(family, attr_name):
     '''
@@ -202,14 +227,10 @@ def format_phone(family, attr_name):
 
 def is_family_exists(families_file: Excel, family_name):
     '''
-    Returns whether a family exists in the excel, by searching for
+    Returns whether a family exists in the excel, by looking for
     a match of family name, assuming a family name property is unique.
     '''
-    search_result = search_families(families_file, family_name, 'name')
-    if len(search_result) > 0 and any(
-            found_family[key_prop] == family_name for found_family in search_result):
-        return True
-    return False
+    return families_file.has_row(family_name)
 
 def validate_phones(family):
     '''
@@ -228,36 +249,68 @@ def validate_phones(family):
         else:
             family[phone_type] = result
 
-def add_family(families_file: Excel, family, excel_cast=to_excel_row):
+def validate_family(families_file: Excel, family, added_names=()):
     '''
-    Adds the given family to the families file. family should be a dictionary
-    with custom family properties, key_prop property required
+    Validates the given family can be added to the families file, and formats its phones.
+    added_names are names of families which are about to be added too.
+
+    Returns:
+        - If family is invalid, an AddFamilyResult is returned.
+        - If family is valid, None is returned.
     '''
     if key_prop not in family:
         return add_results["MISSING_FULL_NAME"]
 
-    if is_family_exists(families_file, family[key_prop]):
+    family_name = family[key_prop]
+    if family_name in added_names or is_family_exists(families_file, family_name):
         return add_results["FAMILY_EXISTS"]
 
-    if validation_error := validate_phones(family):
+    return validate_phones(family)
+
+def add_family(families_file: Excel, family, excel_cast=to_excel_row):
+    '''
+    Adds the given family to the families file. family should be a dictionary
+    with custom family properties, key_prop property required
+    '''
+    family = dict(family)
+    if validation_error := validate_family(families_file, family):
         return validation_error
 
     excel_families = [excel_cast(family)]
     families_file.append_rows(excel_families)
     return add_results["FAMILY_ADDED"]
 
-def add_families(families_file: Excel, families):
+def add_families(families_file: Excel, families, excel_cast=to_excel_row):
     '''
-    Adds a list of families to the families file.
+    Adds a list of families to the families file in a single write.
+
+    Families which fail validation are not added, but don't stop the addition of
+    the other families.
 
-    If error occurres in adding a family, the function will
-    stop the addition of families and return error information.
+    Returns a tuple: (result, added_families)
+        - If any family failed, result is the error of the first failed family,
+          and the errors of all failed families are listed in its errors
+        - added_families are the validated families which were added, even if others failed
     '''
+    added_names = set()
+    added_families = []
+    excel_families = []
+    errors = []
     for family in families:
-        result = add_family(families_file, family)
-        if result.status != 200:
-            return add_many_error(result, family[key_prop])
-    return add_many_results["FAMILIES_ADDED"]
+        family = dict(family)
+        if validation_error := validate_family(families_file, family, added_names):
+            errors.append(add_many_error(validation_error, family.get(key_prop)))
+            continue
+        added_names.add(family[key_prop])
+        added_families.append(family)
+        excel_families.append(excel_cast(family))
+
+    if len(excel_families) > 0:
+        families_file.append_rows(excel_families)
+
+    if len(errors) > 0:
+        return add_many_errors(errors), added_families
+    return add_many_results["FAMILIES_ADDED"], added_families
 
 def update_family(families_file: Excel, original_name, family):
     '''
@@ -278,7 +331,7 @@ def move_family(origin_file: Excel, family_name):
     except Exception as e:
         return e, None
     
-    family_data = origin_file.search(family_name, 'name')[0]
+    family_data = dict(origin_file.search(family_name, 'name')[0])
     origin_file.remove_row(index)
     return None, family_data
 
@@ -376,9 +429,10 @@ def remove_many_drivers(families_file: Excel, drivers):
     if drivers is None or len(drivers) <= 0:
         return
 
-    for family in search_families(families_file):
-        if family.get(driver_prop, None) in drivers:
-            remove_driver(families_file, family.get(key_prop))
+    with families_file.batch():
+        for family in search_families(families_file, fields=[key_prop, driver_prop]):
+            if family.get(driver_prop, None) in drivers:
+                remove_driver(families_file, family.get(key_prop))
 
 def add_driver(families_file: Excel, family_name, driver_name):
     '''
@@ -2,9 +2,11 @@ from os import listdir, path
 
 from src.data import key_prop, system_files_folder, pdf_properties
 from src.drivers import get_drivers_multi_files, get_driver_families, get_driverless_families
+from src.errors import FileNotFoundError
 from src.excel import Excel
 from src.families import search_families, load_families_file, permanent_remove_family, add_families, remove_driver, add_driver
 from src.json import Json
+from src.managers import load_managers_index
 from src.pdf import PDFBuilder
 from src.util import create_folders_path, duplicate_excel_template, get_all_pages
 
@@ -80,11 +82,12 @@ def get_printable_files(holiday_name):
     folder_path = get_holiday_print_folder(holiday_name)
     def without_ending(filename):
         return filename[:-len(holiday_printable_suffix)]
-    return list(map(without_ending, listdir(folder_path)))
+    printables = [filename for filename in listdir(folder_path) if filename.endswith(holiday_printable_suffix)]
+    return list(map(without_ending, printables))
 
 def get_holiday_printable(holiday_name, printable_name):
     '''
-    Returns a single holiday printable file.
+    Returns the path of a single holiday printable file.
     '''
     printables = get_printable_files(holiday_name)
     if len(printables) == 0:
@@ -92,11 +95,9 @@ def get_holiday_printable(holiday_name, printable_name):
 
     filename = printable_name or holiday_main_printable_name
     filepath = get_holiday_print_filepath(holiday_name, filename, with_suffix=True)
-    try:
-        with open(filepath, 'rb') as printable:
-            return printable.read(), None
-    except Exception as e:
-        return None, e
+    if not path.isfile(filepath):
+        return None, FileNotFoundError(f'הקובץ {filename} לא נמצא')
+    return filepath, None
 
 def create_holiday_path(name):
     '''
@@ -105,11 +106,12 @@ def create_holiday_path(name):
     folder_path = get_holiday_path(name)
     create_folders_path(folder_path)
 
-def generate_holiday_main_pdf(holiday_name, managers_file: Json):
+def generate_holiday_main_pdf(holiday_name, managers_file: Json, on_progress=None):
     '''
     Generates new holiday printable based on given managers and holiday families files.
+    If given, on_progress is called with the fraction of pages built.
     '''
-    error, files = load_both_holiday_files(holiday_name)
+    error, files = load_both_holiday_files(holiday_name, read_only=True)
     if error is not None:
         return error
     
@@ -117,17 +119,26 @@ def generate_holiday_main_pdf(holiday_name, managers_file: Json):
     for f in files:
         families += search_families(f)
 
-    managers = managers_file.load_json()
+    managers = load_managers_index(managers_file)
     pages = get_all_pages(managers, families)
     filepath = get_holiday_print_filepath(holiday_name, holiday_main_printable_name)
     builder = PDFBuilder(holiday_main_printable_name, filepath=filepath)
-    builder.build_multi(pages, pdf_properties)
+    builder.build_multi_fragments(pages, pdf_properties, on_progress)
 
 def generate_holiday_custom_pdf(holiday_name, title, content):
     filepath = get_holiday_print_filepath(holiday_name, title)
     builder = PDFBuilder(title, filepath=filepath)
     builder.build_single(title, pdf_properties, content)
 
+def render_holiday_custom_pdf(holiday_name, title, content, save=False):
+    '''
+    Renders new holiday printable out of given content, and returns its bytes.
+    If save is True, the printable is also saved with the holiday printables.
+    '''
+    filepath = get_holiday_print_filepath(holiday_name, title)
+    builder = PDFBuilder(title, filepath=filepath)
+    return builder.build_single_bytes(title, pdf_properties, content, save)
+
 def initialize_holiday(families_file: Excel, holiday_name):
     '''
     Generates new families source file out of current families_file.
@@ -144,30 +155,30 @@ def initialize_holiday(families_file: Excel, holiday_name):
     full_prints_path = get_holiday_print_folder(holiday_name)
     create_folders_path(full_prints_path)
 
-def load_holiday_specific_families_file(holiday_name):
+def load_holiday_specific_families_file(holiday_name, read_only=False):
     '''
     Returns families file of the given holiday.
     '''
     filepath = get_holiday_families_path(holiday_name)
-    return load_families_file(filepath)
+    return load_families_file(filepath, read_only)
 
-def load_added_families_file(holiday_name):
+def load_added_families_file(holiday_name, read_only=False):
     '''
     Returns added families file of the given holiday_name.
     '''
     filepath = get_holiday_added_families_path(holiday_name)
-    return load_families_file(filepath)
+    return load_families_file(filepath, read_only)
 
 def get_holiday_families_status(holiday_file: Excel, holiday_name):
     '''
     Returns added holiday families.
     '''
-    error, added_families_file = load_added_families_file(holiday_name)
+    error, added_families_file = load_added_families_file(holiday_name, read_only=True)
     if error is not None:
         return error, None
 
     added_families = search_families(added_families_file)
-    added_families_names = list(map(lambda f: f[key_prop], added_families))
+    added_families_names = set(map(lambda f: f[key_prop], added_families))
 
     all_holiday_families = search_families(holiday_file)
     def name_filter(family):
@@ -190,28 +201,30 @@ def update_holiday_families_status(holiday_file: Excel, holiday_name, holiday_fa
     already_added_families = search_families(added_families_file)
     already_added_families = list(map(lambda f: f[key_prop], already_added_families))
 
-    for family in already_added_families:
-        if family not in holiday_families:
-            permanent_remove_family(added_families_file, family)
+    with added_families_file.batch():
+        for family in already_added_families:
+            if family not in holiday_families:
+                permanent_remove_family(added_families_file, family)
 
-    families_to_add = []
-    for family_name in holiday_families:
-        if family_name not in already_added_families:
-            families = search_families(holiday_file, family_name, exact=True)
-            if len(families) == 0:
-                continue
-            families_to_add.append(families[0])
-    return None, add_families(added_families_file, families_to_add)
+        families_to_add = []
+        for family_name in holiday_families:
+            if family_name not in already_added_families:
+                families = search_families(holiday_file, family_name, exact=True)
+                if len(families) == 0:
+                    continue
+                families_to_add.append(families[0])
+        result, _ = add_families(added_families_file, families_to_add)
+        return None, result
 
-def load_both_holiday_files(holiday_name):
+def load_both_holiday_files(holiday_name, read_only=False):
     '''
     Returns both holiday families file and holiday added families file, in that order.
     '''
-    error, holiday_families_file = load_holiday_specific_families_file(holiday_name)
+    error, holiday_families_file = load_holiday_specific_families_file(holiday_name, read_only)
     if error is not None:
         return error, None
 
-    error, added_families_file = load_added_families_file(holiday_name)
+    error, added_families_file = load_added_families_file(holiday_name, read_only)
     if error is not None:
         return error, None    
     
@@ -221,7 +234,7 @@ def get_holiday_regular_families(holiday_name):
     '''
     Returns holiday regular families.
     '''
-    error, families_file = load_holiday_specific_families_file(holiday_name)
+    error, families_file = load_holiday_specific_families_file(holiday_name, read_only=True)
     if error is not None:
         return error, None
     
@@ -232,7 +245,7 @@ def get_holiday_drivers(managers_file: Json, holiday_name):
     '''
     Returns all holiday drivers.
     '''
-    error, files = load_both_holiday_files(holiday_name)
+    error, files = load_both_holiday_files(holiday_name, read_only=True)
     if error is not None:
         return error, None
 
@@ -243,7 +256,7 @@ def get_holiday_driver_families(holiday_name, driver_name):
     '''
     Returns all families whom their driver is the given driver in the given holiday.
     '''
-    error, files = load_both_holiday_files(holiday_name)
+    error, files = load_both_holiday_files(holiday_name, read_only=True)
     if error is not None:
         return error, None
     
@@ -256,7 +269,7 @@ def get_holiday_driverless_families(holiday_name):
     '''
     Returns all families without driver in the given holiday.
     '''
-    error, files = load_both_holiday_files(holiday_name)
+    error, files = load_both_holiday_files(holiday_name, read_only=True)
     if error is not None:
         return error, None
     
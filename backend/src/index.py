@@ -0,0 +1,147 @@
+from bisect import bisect_right, insort
+from heapq import merge
+
+from src.util import without_hyphen
+
+def get_grams(text):
+    '''
+    Returns all single characters and character pairs of text.
+    '''
+    return set(text) | {text[i:i + 2] for i in range(len(text) - 1)}
+
+def add_value_grams(grams, value):
+    '''
+    Adds value to the values of each of its grams in the given grams map.
+    '''
+    if value is None:
+        return
+    for gram in get_grams(to_searchable(value)):
+        grams.setdefault(gram, set()).add(value)
+
+def to_searchable(value):
+    '''
+    Returns the text substring lookups should look in. Hyphens are ignored, so lookups
+    can serve phone searches too. Searches should match the found rows again.
+    '''
+    return without_hyphen(str(value))
+
+class ColumnIndex():
+    '''
+    Maps each value of a single column to the indexes of the rows holding it,
+    sorted in sheet order. Should be kept updated by whoever changes the sheet.
+
+    Substring lookups use a characters and character pairs index of the column values,
+    which is built on first substring lookup.
+    '''
+    def __init__(self, column):
+        self.column = column
+        self.rows = {}
+        self.grams = None
+
+    def build(self, values, row_indexes):
+        '''
+        Indexes all given column values, each value is of the row index in the same position.
+        '''
+        for value, row_index in zip(values, row_indexes):
+            self.add(value, row_index)
+        return self
+
+    def add(self, value, row_index):
+        rows = self.rows.get(value)
+        if rows is None:
+            rows = self.rows[value] = []
+            self.add_grams(value)
+
+        if not rows or rows[-1] < row_index:
+            rows.append(row_index)
+        else:
+            insort(rows, row_index)
+
+    def remove(self, value, row_index):
+        rows = self.rows.get(value)
+        if rows is None or row_index not in rows:
+            return
+
+        rows.remove(row_index)
+        if len(rows) == 0:
+            del self.rows[value]
+            self.remove_grams(value)
+
+    def shift(self, removed_row_index):
+        '''
+        Moves up all rows below removed_row_index, as the sheet does when a row is deleted.
+        '''
+        for rows in self.rows.values():
+            for i in range(bisect_right(rows, removed_row_index), len(rows)):
+                rows[i] -= 1
+
+    def first(self, value):
+        '''
+        Returns the index of the first row holding value, or None if there is no such row.
+        '''
+        rows = self.rows.get(value)
+        return rows[0] if rows else None
+
+    def exact(self, value):
+        '''
+        Returns indexes of all rows holding value.
+        '''
+        return list(self.rows.get(value, []))
+
+    def empty(self):
+        '''
+        Returns indexes of all rows without a value.
+        '''
+        return self.merge_rows(value for value in self.rows if not value)
+
+    def contains(self, query):
+        '''
+        Returns indexes of all rows which their value contains query, ignoring hyphens.
+        '''
+        values = [value for value in self.rows if value is not None]
+        if not isinstance(query, str):
+            return self.merge_rows(values) # Let the search handle invalid queries
+
+        query = without_hyphen(query)
+        if query:
+            values = self.get_grams_values(query)
+        return self.merge_rows(value for value in values if query in to_searchable(value))
+
+    def merge_rows(self, values):
+        return list(merge(*(self.rows[value] for value in values)))
+
+    def get_grams_values(self, query):
+        '''
+        Returns all values which contain every character pair of query.
+        '''
+        grams = self.grams
+        if grams is None:
+            # Published only once complete, as concurrent lookups may use it right away
+            grams = {}
+            for value in self.rows:
+                add_value_grams(grams, value)
+            self.grams = grams
+
+        query_grams = [query] if len(query) == 1 else [query[i:i + 2] for i in range(len(query) - 1)]
+        values = None
+        for gram in query_grams:
+            gram_values = grams.get(gram, set())
+            values = set(gram_values) if values is None else values & gram_values
+            if not values:
+                return []
+        return values
+
+    def add_grams(self, value):
+        if self.grams is None:
+            return
+        add_value_grams(self.grams, value)
+
+    def remove_grams(self, value):
+        if self.grams is None or value is None:
+            return
+        for gram in get_grams(to_searchable(value)):
+            values = self.grams.get(gram)
+            if values is not None:
+                values.discard(value)
+                if len(values) == 0:
+                    del self.grams[gram]
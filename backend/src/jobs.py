@@ -0,0 +1,159 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from os import path, remove, replace, scandir
+from threading import Lock
+from time import time
+
+from src.cache import files_cache
+from src.data import system_files_folder
+from src.errors import JobNotFoundError
+from src.results import get_result
+from src.util import create_folders_path, generate_random_id
+
+jobs_folder = f"{system_files_folder}/jobs"
+jobs_workers = 2
+jobs_max_age = 7 * 24 * 60 * 60 # Seconds, finished jobs are kept for a week
+
+class JobStatus():
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    INTERRUPTED = "interrupted"
+
+active_statuses = [JobStatus.QUEUED, JobStatus.RUNNING]
+
+class JobsQueue():
+    '''
+    Runs long operations in a worker pool, outside of the request that submitted them.
+    Each job status is persisted as a json file in folder, so it can be polled by its id.
+
+    A job target is called with its arguments and an on_progress callback, which accepts
+    the fraction of work done. Like other operations, target should return an error or None.
+
+    Finished jobs are kept for max_age seconds since their last update, and are pruned when new jobs are submitted.
+    '''
+    def __init__(self, folder=jobs_folder, max_workers=jobs_workers, max_age=jobs_max_age):
+        self.folder = folder
+        self.max_age = max_age
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self.lock = Lock()
+        self.jobs = {}
+
+    def submit(self, kind, target, *args):
+        '''
+        Queues target to run with the given args, and returns the new job id.
+        '''
+        self.prune()
+        now = time()
+        job = {
+            "id": generate_random_id(),
+            "kind": kind,
+            "status": JobStatus.QUEUED,
+            "progress": 0,
+            "error": None,
+            "created": now,
+            "updated": now,
+        }
+        with self.lock:
+            self.jobs[job["id"]] = job
+            self.save(job)
+
+        self.executor.submit(self.run, job["id"], target, args)
+        return job["id"]
+
+    def run(self, job_id, target, args):
+        self.update(job_id, status=JobStatus.RUNNING)
+
+        def on_progress(fraction):
+            self.update(job_id, progress=min(99, int(fraction * 100)))
+
+        try:
+            error = target(*args, on_progress=on_progress)
+        except Exception as e:
+            error = e
+        finally:
+            files_cache.release_held()
+
+        if error is None:
+            self.update(job_id, status=JobStatus.DONE, progress=100)
+        else:
+            result = get_result(error)
+            self.update(job_id, status=JobStatus.FAILED,
+                        error={ "title": result.title, "description": result.description })
+
+    def update(self, job_id, **changes):
+        '''
+        Applies changes to the job and persists it. Unchanged jobs are not written again.
+        '''
+        with self.lock:
+            job = self.jobs[job_id]
+            if all(job.get(key) == value for key, value in changes.items()):
+                return
+            job.update(changes, updated=time())
+            self.save(job)
+
+    def save(self, job):
+        '''
+        (Internal) Writes job to its file. Should be called with lock held.
+        '''
+        create_folders_path(self.folder)
+        filepath = self.get_job_path(job["id"])
+        temp_filepath = f"{filepath}.tmp"
+        with open(temp_filepath, 'w', encoding='utf-8') as f:
+            json.dump(job, f, ensure_ascii=False)
+        replace(temp_filepath, filepath)
+
+    def prune(self):
+        '''
+        Removes jobs which were last updated more than max_age ago, unless they're still active.
+        Jobs persisted by a previous run of the server are never active, as they're interrupted.
+        '''
+        min_updated_time = time() - self.max_age
+        with self.lock:
+            for job_id, job in list(self.jobs.items()):
+                if job["status"] not in active_statuses and job["updated"] < min_updated_time:
+                    del self.jobs[job_id]
+
+            if not path.exists(self.folder):
+                return
+            for entry in scandir(self.folder):
+                if entry.name.removesuffix(".json") in self.jobs:
+                    continue
+                try:
+                    if entry.stat().st_mtime < min_updated_time:
+                        remove(entry.path)
+                except OSError:
+                    pass
+
+    def get_job_path(self, job_id):
+        return f"{self.folder}/{job_id}.json"
+
+    def get(self, job_id):
+        '''
+        Returns a tuple: (error, job)
+            - If job was not found, job will be None
+            - If job was found, error will be None
+
+        Active jobs persisted by a previous run of the server will never finish,
+        so they are returned as interrupted.
+        '''
+        if not job_id or path.basename(job_id) != job_id:
+            return (JobNotFoundError(f"המשימה {job_id} לא נמצאה"), None)
+
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is not None:
+                return (None, dict(job))
+
+        try:
+            with open(self.get_job_path(job_id), encoding='utf-8') as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            return (JobNotFoundError(f"המשימה {job_id} לא נמצאה"), None)
+
+        if job["status"] in active_statuses:
+            job["status"] = JobStatus.INTERRUPTED
+        return (None, job)
+
+jobs_queue = JobsQueue()
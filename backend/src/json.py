@@ -1,6 +1,8 @@
 import json
 from os import path
 
+from src.cache import files_cache
+
 class Json():
     def __init__(self, filename):
         if not path.exists(filename):
@@ -18,3 +20,5 @@ class Json():
                 json.dump(new_json, f, ensure_ascii=False, indent=2)
         except Exception as e:
             return e
+        finally:
+            files_cache.invalidate(self.filename)
@@ -1,7 +1,45 @@
+from src.cache import files_cache
 from src.data import managers_filename
 from src.json import Json
 from src.util import generate_random_id
 
+ignore_print_status = "ignore"
+
+class ManagersIndex():
+    '''
+    Managers json with lookup tables, built once per managers file version.
+    Shared between requests, so its managers should never be modified.
+
+    driver_status maps each printed driver to its manager name, or to "ignore"
+    if the driver should be print-ignored. Drivers of print-ignored managers are skipped.
+    '''
+    def __init__(self, managers):
+        self.managers = managers
+        self.by_id = {}
+        self.driver_manager = {}
+        self.driver_status = {}
+        self.drivers = get_drivers(managers)
+
+        for manager in managers:
+            self.by_id.setdefault(manager["id"], manager)
+            is_manager_ignored = manager.get('print', None) == ignore_print_status
+
+            for driver in manager["drivers"]:
+                driver_name = driver["name"]
+                self.driver_manager.setdefault(driver_name, manager["name"])
+                if is_manager_ignored or driver_name in self.driver_status:
+                    continue
+                is_driver_ignored = driver.get('print', None) == ignore_print_status
+                self.driver_status[driver_name] = ignore_print_status if is_driver_ignored else manager["name"]
+
+    def find_manager(self, driver_name):
+        '''
+        Returns the name of the first manager of the given driver, or None if not found.
+        '''
+        if not driver_name:
+            return None
+        return self.driver_manager.get(driver_name, None)
+
 def load_managers_file():
     '''
     Connects to the managers source file.
@@ -16,6 +54,14 @@ def load_managers_file():
     except Exception as e:
         return (e, None)
 
+def load_managers_index(managers_file: Json):
+    '''
+    Returns the managers index of the given managers_file, which is cached until the file changes.
+    '''
+    def load():
+        return ManagersIndex(managers_file.load_json())
+    return files_cache.get(managers_file.filename, load, key=(managers_file.filename, "index"))
+
 def get_managers(managers_file: Json):
     '''
     Returns all managers in json format.
@@ -37,16 +83,15 @@ def get_managers_drivers(managers_file: Json):
     '''
     Returns all drivers from the given managers_file.
     '''
-    managers = get_managers(managers_file)
-    return get_drivers(managers)
+    return list(load_managers_index(managers_file).drivers)
 
 def get_drivers_diff(managers_file: Json, new_managers):
     '''
     Returns a list of all drivers that exist in current managers_file,
     but doesn't exist in new_managers.
     '''
-    prev_drivers = get_managers_drivers(managers_file)
-    new_drivers = get_drivers(new_managers)
+    prev_drivers = load_managers_index(managers_file).drivers
+    new_drivers = set(get_drivers(new_managers))
     return [driver for driver in prev_drivers if driver not in new_drivers]
 
 def update_managers(managers_file: Json, managers):
@@ -59,14 +104,7 @@ def find_manager(managers_file: Json, driver_name):
     '''
     Returns the corresponding manager to the given driver, or None if not found.
     '''
-    if not driver_name:
-        return None
-
-    for manager in managers_file.load_json():
-        if any(driver_name == driver['name'] for driver in manager['drivers']):
-            return manager['name']
-
-    return None
+    return load_managers_index(managers_file).find_manager(driver_name)
 
 def remove_manager(managers_file: Json, manager_id):
     '''
@@ -75,11 +113,14 @@ def remove_manager(managers_file: Json, manager_id):
     if not manager_id:
         return
 
-    managers = managers_file.load_json()
+    managers = load_managers_index(managers_file)
+    if str(manager_id) not in managers.by_id:
+        return
+
     new_managers = list(
         filter(
             lambda manager: manager["id"] != str(manager_id),
-            managers))
+            managers.managers))
     return update_managers(managers_file, new_managers)
 
 def add_manager(managers_file: Json, manager_name):
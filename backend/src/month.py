@@ -1,13 +1,14 @@
 from glob import glob
 from os import path, listdir
 
+from src.cache import files_cache
 from src.data import key_prop, pdf_properties, system_files_folder, date_prop, status_prop
-from src.errors import FileAlreadyExists, ActiveReportNotFound
+from src.errors import FileAlreadyExists, ActiveReportNotFound, FileNotFoundError
 from src.families import search_families
-from src.managers import load_managers_file
+from src.managers import load_managers_file, load_managers_index
 from src.report import load_report_file, append_report, report_late_append, get_family_receipt_status, default_receipt, remove_from_report
 from src.pdf import PDFBuilder, get_print_path, get_print_folder_path
-from src.util import duplicate_excel_template, get_all_pages
+from src.util import duplicate_excel_template, get_all_pages, index_records, scaled_progress
 
 month_reports_folder = f"{system_files_folder}/דוחות קבלה"
 month_reports_path = f"{month_reports_folder}/"
@@ -39,16 +40,17 @@ def get_report_name(report_path):
     '''
     return path.basename(report_path)[reportname_start_index:-reportname_end_index]
 
-def load_month_report(report_name):
+def load_month_report(report_name, read_only=False):
     '''
     Connects to a month report file with the given report_name.
+    If read_only is True, the report is opened for queries only.
 
     Returns a tuple: (error, file)
         - If connection has failed, file will be None
         - If connection has succeed, error will be None
     '''
     filepath = get_report_path(report_name)
-    return load_report_file(filepath)
+    return load_report_file(filepath, read_only)
 
 def is_report_name_exists(report_name):
     '''
@@ -70,7 +72,7 @@ def get_reports_list():
     reports = []
     for filepath in glob(month_reports_pattern):
         filename = get_report_name(filepath)
-        error, report = load_report_file(filepath)
+        error, report = load_report_file(filepath, read_only=True)
         if error is not None:
             return error, None
         reports.append({
@@ -97,19 +99,17 @@ def get_active_report():
 
 def get_printable_report(report_name, printable_name):
     '''
-    Returns a single printable file.
+    Returns the path of a single printable file.
     '''
     printables = get_printable_files(report_name)
     if len(printables) == 0:
         return None, None
 
     filename = printable_name or month_printable_report_name
-    path_prefix = get_print_path(report_name, filename)
-    try:
-        with open(f'{path_prefix}{month_printable_suffix}', 'rb') as printable:
-            return printable.read(), None
-    except Exception as e:
-        return None, e
+    filepath = f'{get_print_path(report_name, filename)}{month_printable_suffix}'
+    if not path.isfile(filepath):
+        return None, FileNotFoundError(f'הקובץ {filename} לא נמצא')
+    return filepath, None
 
 def get_printable_files(report_name):
     '''
@@ -118,7 +118,8 @@ def get_printable_files(report_name):
     folder_path = get_print_folder_path(report_name)
     def without_ending(filename):
         return filename[:-len(month_printable_suffix)]
-    return list(map(without_ending, listdir(folder_path)))
+    printables = [filename for filename in listdir(folder_path) if filename.endswith(month_printable_suffix)]
+    return list(map(without_ending, printables))
 
 def get_family_receipt_history(family_name):
     '''
@@ -131,7 +132,7 @@ def get_family_receipt_history(family_name):
     statuses = []
     for report_props in reports_list:
         current_month = report_props["name"]
-        error, report_file = load_month_report(current_month)
+        error, report_file = load_month_report(current_month, read_only=True)
         if error is not None:
             return error, None
         status = get_family_receipt_status(report_file, family_name)
@@ -151,40 +152,48 @@ def generate_month_report(month_name, families, managers_file):
     '''
     Generates new monthly report tracker based on given families and managers.
     If the generated report is the only report, it will be set as active report.
+
+    The report is released once it's written, so requests waiting for it don't wait for
+    the rest of the month generation.
     '''
     sheet_title = f'{month_report_prefix}{month_name}'
     filepath = get_report_path(month_name)
     duplicate_excel_template(month_reports_template, sheet_title, filepath)
 
     error, report_file = load_month_report(month_name)
-    if error is not None:
-        return error
+    try:
+        if error is not None:
+            return error
 
-    append_report(report_file, families, managers_file)
-    
-    error, reports = get_reports_list()
-    if error is not None:
-        return error
-    
-    is_only_report = len(reports) == 1
-    set_report_active_status(report_file, is_only_report)
+        append_report(report_file, families, managers_file)
 
-def generate_month_pdf(month_name, families, managers_file):
+        error, reports = get_reports_list()
+        if error is not None:
+            return error
+
+        is_only_report = len(reports) == 1
+        set_report_active_status(report_file, is_only_report)
+    finally:
+        files_cache.release(filepath)
+
+def generate_month_pdf(month_name, families, managers_file, on_progress=None):
     '''
     Generates new monthly report in print format based on given families and managers.
     '''
-    managers = managers_file.load_json()
+    managers = load_managers_index(managers_file)
     pages = get_all_pages(managers, families)
     builder = PDFBuilder(month_printable_report_name, folder=month_name)
-    builder.build_multi(pages, pdf_properties)
+    builder.build_multi_fragments(pages, pdf_properties, on_progress)
 
-def generate_month_files(families_file, month_name, override_name=False):
+def generate_month_files(families_file, month_name, override_name=False, on_progress=None):
     '''
     Generates new month report with the given month_name, based on current families and managers files.
     Allows override of exist report by setting override_name to True.
 
     In addition to monthly report tracker file, this function generates a pdf file which contains
     all managers, drivers and families for this month.
+
+    If given, on_progress is called with the fraction of work done.
     '''
     if not override_name and not is_report_name_exists(month_name):
         return FileAlreadyExists(f"דוח קבלה בשם {month_name} קיים כבר")
@@ -196,7 +205,9 @@ def generate_month_files(families_file, month_name, override_name=False):
     families = search_families(families_file)
 
     generate_month_report(month_name, families, managers_file)
-    generate_month_pdf(month_name, families, managers_file)
+    if on_progress is not None:
+        on_progress(0.3)
+    generate_month_pdf(month_name, families, managers_file, scaled_progress(on_progress, 0.3, 1))
 
 def generate_completion_pdf(month_name, title, families_file, families):
     '''
@@ -206,12 +217,21 @@ def generate_completion_pdf(month_name, title, families_file, families):
     builder = PDFBuilder(title, folder=month_name)
     builder.build_single(title, pdf_properties, pdf_content)
 
+def render_completion_pdf(month_name, title, families_file, families, save=False):
+    '''
+    Renders new completion file in print format, and returns its bytes.
+    If save is True, the file is also saved with the month printables.
+    '''
+    pdf_content = get_families_content(families_file, families)
+    builder = PDFBuilder(title, folder=month_name)
+    return builder.build_single_bytes(title, pdf_properties, pdf_content, save)
+
 def get_families_content(families_file, completion_families):
     families_content = []
-    families = search_families(families_file)
+    families = index_records(search_families(families_file))
 
     for cf in completion_families:
-        family = next((f for f in families if f[key_prop] == cf[key_prop]), None)
+        family = families.get(cf[key_prop])
         if family is not None:
             families_content.append(family)
     
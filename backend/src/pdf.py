@@ -1,19 +1,38 @@
+import json
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from hashlib import sha256
+from io import BytesIO
+from multiprocessing import get_context
+from os import cpu_count, path, remove, replace, scandir, utime
+from threading import Lock
+from time import time
+
+from pypdf import PdfReader, PdfWriter
+
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import cm
 
 from reportlab.platypus import SimpleDocTemplate, Table, Paragraph, PageTemplate, PageBreak, NextPageTemplate
 from reportlab.platypus.frames import Frame
 
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-
 from bidi.algorithm import get_display
 
 from src.data import system_files_folder, key_prop, notes_prop
+from src.pdf_fonts import register_fonts, get_fonts_signature
+from src.records import to_json_value
 from src.styles import Styles
-from src.util import create_folders_path
-
-fonts_dir = "./src/fonts/"
+from src.util import create_folders_path, generate_random_id
+
+pdf_hash_suffix = ".pdf.sha256"
+# Should be increased whenever pdf layout or styles change, to rebuild cached pdf documents
+pdf_format_version = 1
+bidi_cache_size = 8192
+pdf_author = 'גמ"ח אבישי - ישיבת קרית שמונה'
+fragments_dir = f"{system_files_folder}/.cache/pdf_fragments"
+fragments_max_age = 30 * 24 * 60 * 60
 print_dir_name = f"{system_files_folder}/הדפסות"
 print_dir = f"./{print_dir_name}"
 
@@ -26,10 +45,118 @@ def get_print_path(folder, name):
     folder_path = get_print_folder_path(folder)
     return f"{folder_path}/{name}"
 
+@lru_cache(maxsize=bidi_cache_size)
+def to_display(text):
+    '''
+    Memoized bidi display conversion, as the same texts repeat all over pdf documents.
+    '''
+    return get_display(text)
+
 def to_hebrew(text):
     if text is None or text == "":
         return ""
-    return get_display(str(text))
+    return to_display(str(text))
+
+def to_hebrew_row(values):
+    '''
+    Converts all given values of a single table row.
+    '''
+    return [to_hebrew(value) for value in values]
+
+def get_bidi_cache_info():
+    '''
+    Returns hits, misses, maxsize and currsize of the bidi conversion cache, for tuning bidi_cache_size.
+    '''
+    return to_display.cache_info()
+
+def split_pages(pages):
+    '''
+    Splits pages into fragments which start on a new pdf page, so each fragment can be
+    rendered on its own and the rendered fragments can be concatenated in order.
+    Each title page starts a fragment of its part of the document (a manager and its drivers),
+    except for a first title page which follows other pages, as it doesn't break from them.
+
+    Fragments are kept as large as parts, since each rendered fragment embeds its own fonts.
+    '''
+    fragments = []
+    inserted_title = False
+    for page in pages:
+        is_title_page = "content" not in page and "title" in page
+        if not fragments or (is_title_page and inserted_title):
+            fragments.append([page])
+        else:
+            fragments[-1].append(page)
+        inserted_title = inserted_title or is_title_page
+    return fragments
+
+def render_fragments(fragments, headers):
+    '''
+    Renders each of the given (filepath, pages, continued) fragments into its own pdf file.
+    Runs in a pdf pool process.
+    '''
+    for filepath, pages, continued in fragments:
+        temp_filepath = f"{filepath}.{generate_random_id()}"
+        builder = PDFBuilder("", filepath=temp_filepath)
+        doc = builder.start_document()
+        builder.append_pages(pages, headers, continued)
+        builder.finish_document(doc)
+        replace(f"{temp_filepath}.pdf", f"{filepath}.pdf")
+
+def prune_fragments():
+    '''
+    Removes cached fragments which weren't used by any document lately.
+    '''
+    min_used_time = time() - fragments_max_age
+    for entry in scandir(fragments_dir):
+        try:
+            if entry.stat().st_mtime < min_used_time:
+                remove(entry.path)
+        except OSError:
+            pass
+
+pdf_pool = None
+pdf_pool_lock = Lock()
+pdf_workers = min(4, cpu_count() or 1)
+
+def get_pdf_pool():
+    '''
+    Returns the process pool which renders pdf fragments, started on first use.
+    '''
+    global pdf_pool
+    with pdf_pool_lock:
+        if pdf_pool is None:
+            pdf_pool = ProcessPoolExecutor(max_workers=pdf_workers, mp_context=get_context("spawn"), initializer=register_fonts)
+        return pdf_pool
+
+def discard_pdf_pool(pool):
+    '''
+    Shuts down the given pdf pool, so the next get_pdf_pool() starts a new one.
+    A worker which crashed breaks the whole pool, which can't run anything else.
+    '''
+    global pdf_pool
+    with pdf_pool_lock:
+        if pdf_pool is pool:
+            pdf_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def to_hashable(value):
+    return to_json_value(value) if isinstance(value, Mapping) else str(value)
+
+def get_content_hash(filename, inputs):
+    '''
+    Returns a hash of everything a pdf document is rendered out of: its filename (which is its title),
+    the given build inputs, the fonts and the pdf format version.
+    '''
+    content = [pdf_format_version, get_fonts_signature(), filename, inputs]
+    serialized = json.dumps(content, ensure_ascii=False, sort_keys=True, default=to_hashable)
+    return sha256(serialized.encode('utf-8')).hexdigest()
+
+def read_content_hash(hash_filepath):
+    try:
+        with open(hash_filepath) as f:
+            return f.read()
+    except OSError:
+        return None
 
 def basad_header(canvas, doc):
     content = Paragraph(to_hebrew('בס"ד'), Styles.header_style)
@@ -61,30 +188,24 @@ class PDFBuilder():
         self.notes_item_title_prop = key_prop
         self.notes_item_content_prop = notes_prop
 
-        pdfmetrics.registerFont(
-            TTFont(
-                'Hebrew',
-                f'{fonts_dir}Rubik-Regular.ttf'))
-        pdfmetrics.registerFont(
-            TTFont(
-                'Hebrew-Bold',
-                f'{fonts_dir}Rubik-Bold.ttf'))
+        register_fonts()
 
-    def start_document(self):
+    def start_document(self, target=None):
         '''
         (Internal) First function to call when generating document.
-        Returns a customizable pdf document.
+        Returns a customizable pdf document, which is written to target file-like object if given,
+        or to the builder pdf file otherwise.
         '''
         self.elements = []
         return SimpleDocTemplate(
-            f"{self.filepath}.pdf",
+            target or f"{self.filepath}.pdf",
             pagesize=A4,
             leftMargin=2.2 * cm,
             rightMargin=2.2 * cm,
             topMargin=1.5 * cm,
             bottomMargin=2.5 * cm,
             title=self.filename,
-            author='גמ"ח אבישי - ישיבת קרית שמונה')
+            author=pdf_author)
 
     def finish_document(self, doc):
         '''
@@ -119,41 +240,176 @@ class PDFBuilder():
         self.append_table(headers, content)
         self.append_notes(content)
 
-    def build_multi(self, pages, headers):
+    def build_multi(self, pages, headers, on_progress=None):
         '''
         Builds a multi-page pdf document. Each page dictionary in the pages list should have
         title and content, which would render to a single-pdf page in the document.
 
         Page could also be a title page without a content, to be used as a delimiter page
         between different parts in the document.
+
+        If given, on_progress is called with the fraction of pages added to the document.
+        '''
+        self.build_cached(("multi", pages, headers), lambda: self.render_multi(pages, headers, on_progress))
+
+    def render_multi(self, pages, headers, on_progress=None):
+        '''
+        (Internal) Renders the document of build_multi().
         '''
         doc = self.start_document()
+        self.append_pages(pages, headers, on_progress=on_progress)
+        self.finish_document(doc)
+        if on_progress is not None:
+            on_progress(1)
 
+    def build_multi_fragments(self, pages, headers, on_progress=None):
+        '''
+        Builds the same document as build_multi(), out of separately rendered fragments of pages.
+        Fragments are cached by their content, so only fragments which changed since previous builds
+        are rendered, in the pdf pool if there is more than a single cpu to render on.
+
+        If given, on_progress is called with the fraction of fragments rendered.
+        '''
+        self.build_cached(("multi", pages, headers), lambda: self.render_multi_fragments(pages, headers, on_progress))
+
+    def render_multi_fragments(self, pages, headers, on_progress=None):
+        '''
+        (Internal) Renders the document of build_multi_fragments().
+        '''
+        fragments_pages = split_pages(pages)
+        if len(fragments_pages) == 0:
+            return self.render_multi(pages, headers, on_progress)
+
+        create_folders_path(fragments_dir)
+        fragments = {}
+        fragments_filepaths = []
+        for index, fragment_pages in enumerate(fragments_pages):
+            continued = index > 0
+            fragment_hash = get_content_hash("", ("fragment", fragment_pages, headers, continued))
+            filepath = f"{fragments_dir}/{fragment_hash}"
+            fragments.setdefault(filepath, (fragment_pages, continued))
+            fragments_filepaths.append(filepath)
+
+        missing_fragments = [(filepath, fragment_pages, continued)
+            for filepath, (fragment_pages, continued) in fragments.items() if not path.exists(f"{filepath}.pdf")]
+        self.render_missing_fragments(missing_fragments, headers, on_progress)
+
+        writer = PdfWriter()
+        for filepath in fragments_filepaths:
+            writer.append(f"{filepath}.pdf")
+        for filepath in fragments:
+            utime(f"{filepath}.pdf")
+        writer.add_metadata({ "/Title": self.filename, "/Author": pdf_author })
+        writer.write(f"{self.filepath}.pdf")
+        prune_fragments()
+
+        if on_progress is not None:
+            on_progress(1)
+
+    def render_missing_fragments(self, fragments, headers, on_progress=None):
+        '''
+        (Internal) Renders the given fragments, in batches which are reported to on_progress.
+        '''
+        if pdf_workers <= 1:
+            for done_count, fragment in enumerate(fragments, 1):
+                render_fragments([fragment], headers)
+                if on_progress is not None:
+                    on_progress(done_count / (len(fragments) + 1))
+            return
+
+        batches_count = min(len(fragments), pdf_workers * 4)
+        batches = [fragments[i::batches_count] for i in range(batches_count)]
+        pool = get_pdf_pool()
+        try:
+            futures = [pool.submit(render_fragments, batch, headers) for batch in batches]
+            for done_count, future in enumerate(as_completed(futures), 1):
+                future.result()
+                if on_progress is not None:
+                    on_progress(done_count / (batches_count + 1))
+        except BrokenProcessPool:
+            discard_pdf_pool(pool)
+            raise
+
+    def append_pages(self, pages, headers, continued=False, on_progress=None):
+        '''
+        (Internal) Appends the given pages to the pdf document.
+        If continued is True, pages are the continuation of a document split by split_pages(),
+        so the first page doesn't break from the (previous) document pages.
+        '''
         inserted_first = False
-        for page in pages:
+        for page_index, page in enumerate(pages):
+            if on_progress is not None:
+                on_progress(page_index / (len(pages) + 1))
+
+            is_continued_page = continued and page_index == 0
             if "content" not in page:
                 if "title" in page:
-                    if inserted_first:
+                    if inserted_first and not is_continued_page:
                         self.append_page_break()
                     self.append_title_page(page["title"])
                     inserted_first = True
                 continue
 
-            self.append_page_break()
+            if not is_continued_page:
+                self.append_page_break()
             self.append_page(page["title"], headers, page["content"])
 
-        self.finish_document(doc)
-
     def build_single(self, title, headers, content):
         '''
         Builds a single-page pdf document with a title and a table.
         '''
-        doc = self.start_document()
+        self.build_cached(("single", title, headers, content), lambda: self.render_single(title, headers, content))
+
+    def build_single_bytes(self, title, headers, content, save=False):
+        '''
+        Builds the document of build_single() in memory and returns its bytes.
+        If save is True, the document is also written to the pdf file, unless it is up to date.
+        '''
+        buffer = BytesIO()
+        self.render_single(title, headers, content, buffer)
+        pdf_bytes = buffer.getvalue()
+
+        if save:
+            self.build_cached(("single", title, headers, content), lambda: self.write_pdf(pdf_bytes))
+        return pdf_bytes
+
+    def render_single(self, title, headers, content, target=None):
+        '''
+        (Internal) Renders the document of build_single().
+        '''
+        doc = self.start_document(target)
 
         self.append_page(title, headers, content)
 
         self.finish_document(doc)
 
+    def build_cached(self, inputs, render):
+        '''
+        (Internal) Renders the pdf document only if it is missing or was built out of different inputs.
+        The inputs hash is stored next to the pdf file, and is removed while rendering,
+        so a failed render is never considered up to date.
+        '''
+        content_hash = get_content_hash(self.filename, inputs)
+        pdf_filepath = f"{self.filepath}.pdf"
+        hash_filepath = f"{self.filepath}{pdf_hash_suffix}"
+        if path.exists(pdf_filepath) and read_content_hash(hash_filepath) == content_hash:
+            return
+
+        if path.exists(hash_filepath):
+            remove(hash_filepath)
+        render()
+        with open(hash_filepath, 'w') as f:
+            f.write(content_hash)
+
+    def write_pdf(self, pdf_bytes):
+        '''
+        (Internal) Writes the given rendered document to the pdf file.
+        '''
+        temp_filepath = f"{self.filepath}.{generate_random_id()}"
+        with open(temp_filepath, 'wb') as f:
+            f.write(pdf_bytes)
+        replace(temp_filepath, f"{self.filepath}.pdf")
+
     def append_page_break(self):
         '''
         Appends a Page Break to the pdf document, in order to start a new page.
@@ -192,7 +448,7 @@ class PDFBuilder():
         '''
         Transforms the given headers into the first row of the pdf table.
         '''
-        table_headers = [to_hebrew(h) for h in headers]
+        table_headers = to_hebrew_row(headers)
         table_headers.reverse()
         return table_headers
 
@@ -202,7 +458,7 @@ class PDFBuilder():
         '''
         table_data = []
         for data_row in content:
-            table_row = [to_hebrew(data_row.get(h)) for h in headers]
+            table_row = to_hebrew_row(data_row.get(h) for h in headers)
             table_row.reverse()
             table_data.append(table_row)
         return table_data
@@ -0,0 +1,35 @@
+from os import path
+from threading import Lock
+
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+fonts_dir = "./src/fonts/"
+pdf_fonts = [('Hebrew', 'Rubik-Regular.ttf'), ('Hebrew-Bold', 'Rubik-Bold.ttf')]
+
+fonts_lock = Lock()
+fonts_signature = None
+
+def register_fonts():
+    '''
+    Loads and registers the pdf fonts, once per process.
+    Should be called before building pdf documents, may be called at process startup to preload fonts.
+    '''
+    global fonts_signature
+    with fonts_lock:
+        if fonts_signature is not None:
+            return
+
+        signature = []
+        for name, font_filename in pdf_fonts:
+            font_path = f"{fonts_dir}{font_filename}"
+            pdfmetrics.registerFont(TTFont(name, font_path))
+            signature.append((name, font_filename, path.getsize(font_path)))
+        fonts_signature = signature
+
+def get_fonts_signature():
+    '''
+    Returns the registered fonts names, files and sizes, which identify the fonts pdf documents are rendered with.
+    '''
+    register_fonts()
+    return fonts_signature
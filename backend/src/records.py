@@ -0,0 +1,84 @@
+from collections.abc import Mapping
+
+class RecordSchema():
+    '''
+    Headers of records, shared by all records of the same headers.
+    '''
+    __slots__ = ("headers", "positions")
+
+    def __init__(self, headers):
+        self.headers = headers
+        self.positions = { header: position for position, header in enumerate(headers) }
+
+record_schemas = {}
+
+def get_schema(headers):
+    '''
+    Returns the schema of the given headers, created once per headers.
+    Sheets share their headers (family_properties, history_properties, holiday_properties
+    and report_properties), so all their rows share a few schemas.
+    '''
+    headers = tuple(headers)
+    schema = record_schemas.get(headers)
+    if schema is None:
+        schema = record_schemas.setdefault(headers, RecordSchema(headers))
+    return schema
+
+class Record(Mapping):
+    '''
+    Read-only row of values, which are accessed by their headers like a dict.
+    Stores only a row values tuple and its shared schema, instead of a hash table per row.
+    Use to_dict() to get a modifiable copy.
+    '''
+    __slots__ = ("schema", "row_values")
+
+    def __init__(self, schema: RecordSchema, values):
+        self.schema = schema
+        self.row_values = tuple(values)
+
+    def __getitem__(self, key):
+        position = self.schema.positions.get(key)
+        if position is None:
+            raise KeyError(key)
+        return self.row_values[position]
+
+    def __contains__(self, key):
+        return key in self.schema.positions
+
+    def __iter__(self):
+        return iter(self.schema.headers)
+
+    def __len__(self):
+        return len(self.schema.headers)
+
+    def get(self, key, default=None):
+        position = self.schema.positions.get(key)
+        return default if position is None else self.row_values[position]
+
+    def to_dict(self):
+        '''
+        Returns a dict of the record values. Much faster than dict(record), which looks up each header.
+        '''
+        return dict(zip(self.schema.headers, self.row_values))
+
+    def __repr__(self):
+        return f"Record({self.to_dict()!r})"
+
+    def __reduce__(self):
+        return (to_record, (self.schema.headers, self.row_values))
+
+def to_record(headers, values):
+    '''
+    Returns a record of the given headers and values, in the same order.
+    '''
+    return Record(get_schema(headers), values)
+
+def to_json_value(value):
+    '''
+    Returns a json serializable version of records, to be used as json default function.
+    '''
+    if isinstance(value, Record):
+        return value.to_dict()
+    if isinstance(value, Mapping):
+        return dict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -1,14 +1,17 @@
 from enum import Enum
 from re import match
 
+from src.cache import files_cache
 from src.data import report_properties, key_prop, street_prop, driver_prop, date_prop, status_prop, date_pattern, default_date, default_status
 from src.errors import FamilyNotFoundError
 from src.excel import Excel
 from src.families import search_families, permanent_remove_family
 from src.json import Json
-from src.managers import find_manager
+from src.managers import ManagersIndex, load_managers_index
 from src.results import receipt_update_results
 from src.styles import report_cell_style, report_received_style, report_not_received_style, report_received_name, report_not_received_name, style_name
+from src.table import and_masks
+from src.util import index_records
 
 class ReportSearchBy(Enum):
     NAME = 'name'
@@ -50,23 +53,33 @@ default_receipt = {
     "status": default_status
 }
 
-def load_report_file(path):
+def load_report_file(path, read_only=False):
     '''
-    Connects to a report file.
+    Connects to a report file. Loaded reports are cached until they are modified.
+    If read_only is True, the report is opened for queries only. Otherwise, the report
+    is held by the loading thread, until it calls files_cache.release_held().
 
     Returns a tuple: (error, file)
         - If connection has failed, file will be None
         - If connection has succeed, error will be None
     '''
-    try:
+    def load():
         report = Excel(
             filename=path,
             row_properties=report_properties,
             search_enum=ReportSearchBy,
-            required_style=report_cell_style
+            required_style=report_cell_style,
+            read_only=read_only
         )
-        report.add_named_style(report_received_style)
-        report.add_named_style(report_not_received_style)
+        if not read_only:
+            report.add_named_style(report_received_style)
+            report.add_named_style(report_not_received_style)
+        return report
+
+    if not read_only:
+        files_cache.hold(path)
+    try:
+        report = files_cache.get(path, load, key=(path, read_only))
         return (None, report)
     except Exception as e:
         return (e, None)
@@ -77,41 +90,24 @@ def get_no_manager_drivers(families_file: Excel, managers_file: Json):
     '''
     Returns all the drivers from families file that have no corresponding manager in managers file.
     '''
-    no_manager_drivers = []
-
-    for family in search_families(families_file):
-        family_key = family.get(key_prop, None)
-        driver = family.get("נהג", None)
-        if family_key is None or driver is None:
-            continue
-
-        manager = find_manager(managers_file, driver)
-        if manager is None:
-            for d in no_manager_drivers:
-                if d["name"] == driver:
-                    d["count"] += 1
-                    break
-            else:
-                no_manager_drivers.append({ "name": driver, "count": 1 })
-
+    managers = load_managers_index(managers_file)
+    table = families_file.get_columns_table()
+    has_driver = and_masks(table.has_value(key_prop), table.has_value(driver_prop))
+    drivers_count = table.group_count(driver_prop, has_driver)
+
+    no_manager_drivers = [
+        { "name": driver, "count": count } for driver, count in drivers_count.items()
+        if managers.find_manager(driver) is None
+    ]
     return None, no_manager_drivers
 
 def get_no_driver_families(families_file: Excel):
     '''
     Returns all the families from families file that doesn't have a driver.
     '''
-    no_driver_families = 0
-
-    for family in search_families(families_file):
-        family_key = family.get(key_prop, None)
-        if family_key is None:
-            continue
-
-        driver = family.get("נהג", None)
-        if driver is None:
-            no_driver_families += 1
-
-    return None, no_driver_families
+    table = families_file.get_columns_table()
+    no_driver = and_masks(table.has_value(key_prop), table.is_empty(driver_prop))
+    return None, table.count(no_driver)
 
 # Report generation
 
@@ -119,7 +115,8 @@ def append_report(report_file: Excel, families, managers_file):
     '''
     Appends all given families to the given report.
     '''
-    excel_families = list(map(lambda f: to_excel_row(f, managers_file), families))
+    managers = load_managers_index(managers_file)
+    excel_families = list(map(lambda f: to_excel_row(f, managers), families))
     report_file.append_rows(excel_families)
 
 def report_late_append(report_file: Excel, families):
@@ -135,7 +132,7 @@ def report_late_append(report_file: Excel, families):
     excel_families = list(map(family_to_excel_row, families))
     report_file.append_rows(excel_families)
 
-def to_excel_row(family, managers_file):
+def to_excel_row(family, managers: ManagersIndex):
     '''
     Cast family data to report excel row format in the right order.
     If family is missing key_prop, detailed exception is raised.
@@ -146,7 +143,7 @@ def to_excel_row(family, managers_file):
         raise Exception(f"שגיאה ביצירת דוח קבלה חודשי: למשפחה {family} אין שם")
 
     driver = family.get("נהג", default_driver)
-    manager = find_manager(managers_file, driver) or default_manager
+    manager = managers.find_manager(driver) or default_manager
 
     return [family_key, manager, driver, None, None]
 
@@ -158,10 +155,11 @@ def remove_from_report(report_file: Excel, family_name):
 
 # Report data tracking
 
-def search_report(report_file: Excel, query='', search_by=''):
+def search_report(report_file: Excel, query='', search_by='', fields=None):
     '''
     Returns list of families from the given report_file,
-    who their value of the search_by cell matches the given query
+    who their value of the search_by cell matches the given query.
+    If fields are given, families contain only these properties.
     '''
     query = '' if query is None else query
     search_by = '' if search_by is None else search_by
@@ -170,7 +168,27 @@ def search_report(report_file: Excel, query='', search_by=''):
         query,
         search_by,
         search_style='receive',
-        style_map=report_style_map)
+        style_map=report_style_map,
+        fields=fields)
+
+def search_report_page(report_file: Excel, query='', search_by='', limit=None, cursor=None, with_total=False, fields=None):
+    '''
+    Returns a SearchPage of families from the given report_file,
+    who their value of the search_by cell matches the given query.
+    Up to limit families are returned, starting after cursor.
+    '''
+    query = '' if query is None else query
+    search_by = '' if search_by is None else search_by
+
+    return report_file.style_search_page(
+        query,
+        search_by,
+        search_style='receive',
+        style_map=report_style_map,
+        limit=limit,
+        cursor=cursor,
+        with_total=with_total,
+        fields=fields)
 
 def search_report_column(report_file: Excel, query='', search_by=''):
     '''
@@ -187,7 +205,7 @@ def get_report_completion_families(report_file: Excel, families_file: Excel):
     and only families to whom a package was sent and didn't get it.
     Each completion family has a name, driver and street.
     '''
-    families = search_families(families_file)
+    families = index_records(search_families(families_file))
 
     def status_filter(family):
         not_received = family[status_prop] == report_style_map[report_not_received_name]
@@ -199,8 +217,7 @@ def get_report_completion_families(report_file: Excel, families_file: Excel):
         if not family[key_prop]:
             return {}
 
-        family_data = next(
-            (f for f in families if f[key_prop] == family[key_prop]), None)
+        family_data = families.get(family[key_prop])
         return {} if family_data is None else {
             key_prop: family[key_prop],
             street_prop: family_data[street_prop],
@@ -280,11 +297,12 @@ def update_driver_receipt_status(report_file: Excel, status):
     Returns proper Result object.
     '''
     errors = 0
-    for family in status:
-        name = family.get("name")
-        result = update_family_receipt_status(report_file, name, family)
-        if result.status != 200:
-            errors += 1
+    with report_file.batch():
+        for family in status:
+            name = family.get("name")
+            result = update_family_receipt_status(report_file, name, family)
+            if result.status != 200:
+                errors += 1
 
     result = "UPDATE_FAILED" if errors == len(status) else (
         "DRIVER_UPDATED" if errors == 0 else "PARTIAL_UPDATE")
@@ -312,16 +330,17 @@ def update_family_receipt_status(report_file: Excel, family_name, receipt):
     if not validate_date_format(date):
         return receipt_update_results["DATE_MALFORMED"]
 
-    report_file.replace_cell(index, {
-        "key": date_prop,
-        "value": date
-    })
-
-    if (status := receipt.get("status", None)) is not None:
-        style = report_received_name if status else report_not_received_name
+    with report_file.batch():
         report_file.replace_cell(index, {
-            "key": status_prop,
-            "style": style
+            "key": date_prop,
+            "value": date
         })
 
+        if (status := receipt.get("status", None)) is not None:
+            style = report_received_name if status else report_not_received_name
+            report_file.replace_cell(index, {
+                "key": status_prop,
+                "style": style
+            })
+
     return receipt_update_results["RECEIPT_UPDATED"]
@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field, replace
 
 @dataclass
 class Result:
@@ -26,6 +26,7 @@ add_results = {
 @dataclass
 class AddManyResult(Result):
     family_key: any
+    errors: list = field(default_factory=list, compare=False)
 
 add_many_results = {
     "FAMILIES_ADDED":   AddManyResult(200, "Families Added", "המשפחות נוספו בהצלחה", None),
@@ -34,6 +35,12 @@ add_many_results = {
 def add_many_error(result: Result, family_key):
     return AddManyResult(result.status, result.title, result.description, family_key)
 
+def add_many_errors(errors):
+    '''
+    Returns the first of the given errors, which lists all given errors.
+    '''
+    return replace(errors[0], errors=errors)
+
 receipt_update_results = {
     "RECEIPT_UPDATED":  Result(200, "Receipt Updated", "סטטוס הקבלה עודכן בהצלחה"),
     "DRIVER_UPDATED":   Result(200, "Driver Updated", "סטטוס הקבלה של כל המשפחות עודכן בהצלחה"),
@@ -2,7 +2,9 @@ from openpyxl.worksheet.worksheet import Worksheet
 from dataclasses import dataclass
 from typing import Any, Dict, List, Generator
 from enum import Enum
+from itertools import islice
 
+from src.records import Record, get_schema
 from src.util import without_hyphen
 
 @dataclass
@@ -28,6 +30,8 @@ class SearchRequest(BaseRequest):
     search_by: str
     empty_search: bool = False
     exact: bool = False
+    limit: int = None
+    fields: List[str] = None
 
 @dataclass
 class StyleSearchRequest(BaseRequest):
@@ -36,30 +40,85 @@ class StyleSearchRequest(BaseRequest):
     search_style: str
     style_map: Dict[str, Any]
     exact: bool = False
+    limit: int = None
+    fields: List[str] = None
+
+@dataclass
+class SearchPage:
+    '''
+    Search results, which continue after next_cursor if it isn't None.
+    total is the number of all matching rows, if requested.
+    '''
+    results: List[Dict[str, Any]]
+    next_cursor: int = None
+    total: int = None
+
+class RowsCursor():
+    '''
+    Iterates the rows of the given sorted row indexes, and remembers where the iteration stopped,
+    so a search which stopped early can be continued from there.
+    '''
+    def __init__(self, row_indexes, get_row):
+        self.row_indexes = row_indexes
+        self.get_row = get_row
+        self.position = 0
+
+    def __iter__(self):
+        for self.position, row_index in enumerate(self.row_indexes, 1):
+            yield self.get_row(row_index)
+
+    def get_next_cursor(self):
+        '''
+        Returns the index of the last iterated row, or None if all rows were iterated.
+        '''
+        if self.position == 0 or self.position >= len(self.row_indexes):
+            return None
+        return self.row_indexes[self.position - 1]
+
+def get_cell_style(cell):
+    '''
+    Returns the named style of the given cell, openpyxl cells and xlsx reader cells alike.
+    '''
+    return cell.style
 
 def is_match(request, value):
     return request.query == value if request.exact else request.query in value
 
-def search(request: SearchRequest):
-    searching_by_phone = bool('PHONE' in request.search_enum.__members__ and
-                              request.search_by == request.search_enum.PHONE.value)
+def is_phone_search(search_enum, search_by):
+    return bool('PHONE' in search_enum.__members__ and search_by == search_enum.PHONE.value)
+
+def get_result_columns(request):
+    '''
+    Returns (index, header) of each column search results should contain.
+    If request fields are given, only their columns are returned, otherwise all columns are.
+    '''
+    return [(index, header) for index, header in enumerate(request.headers)
+            if request.fields is None or header in request.fields]
+
+def limit_rows(request, rows):
+    '''
+    Returns the first request limit rows of rows, or all rows if there is no limit.
+    The limit is checked before each row, so a limit of 0 returns no rows, and no row is pulled
+    past the limit, which keeps the cursor of a paged search right after its last result.
+    '''
+    return rows if request.limit is None else islice(rows, request.limit)
+
+def get_matching_rows(request: SearchRequest):
+    '''
+    Yields the rows of rows_iter which match the given search request.
+    '''
+    searching_by_phone = is_phone_search(request.search_enum, request.search_by)
     if searching_by_phone:
         request.query = without_hyphen(request.query)
 
     search_columns = request.search_enum.get_search_columns(request.search_by)
 
-    matching_rows = []
-    def append_matching_row(row):
-        matching_rows.append({
-            request.headers[index]: cell.value for index, cell in enumerate(row) if index < len(request.headers)
-        })
-
     for row in request.rows_iter:
         for column in search_columns:
             cell_value = row[column].value
             if request.empty_search:
                 if not cell_value:
-                    append_matching_row(row)
+                    yield row
                 continue
 
             if cell_value is None:
@@ -67,41 +126,60 @@ def search(request: SearchRequest):
             if searching_by_phone:
                 cell_value = without_hyphen(cell_value)
             if is_match(request, cell_value):
-                append_matching_row(row)
+                yield row
                 break # Row added to matching_rows, skip to next row
+
+def get_cell_value(row, index):
+    return row[index].value if index < len(row) else None
+
+def search(request: SearchRequest):
+    result_columns = get_result_columns(request)
+    schema = get_schema(header for _, header in result_columns)
+
+    matching_rows = []
+    for row in limit_rows(request, get_matching_rows(request)):
+        matching_rows.append(Record(schema, [get_cell_value(row, index) for index, _ in result_columns]))
     return matching_rows
 
-def style_search(request: StyleSearchRequest):
+def get_style_matching_rows(request: StyleSearchRequest):
+    '''
+    Yields the rows of rows_iter which match the given style search request.
+    '''
     search_columns = request.search_enum.get_search_columns(request.search_by)
-    style_columns = request.search_enum.get_search_columns(
-        request.search_style)
 
-    matching_rows = []
     for row in request.rows_iter:
         for column in search_columns:
             cell_value = row[column].value
             if cell_value is None:
                 continue # Don't insert no value cell into search result
             if is_match(request, cell_value):
-                matching_row = {}
-                for index, cell in enumerate(row):
-                    key = request.headers[index]
-                    if index in style_columns:
-                        style_value = request.style_map.get(cell.style, None)
-                        matching_row |= { key: style_value }
-                    else:
-                        matching_row |= { key: cell.value }
-                matching_rows.append(matching_row)
+                yield row
                 break # Row added to matching_rows, skip to next row
+
+def style_search(request: StyleSearchRequest):
+    style_columns = request.search_enum.get_search_columns(
+        request.search_style)
+    result_columns = get_result_columns(request)
+    schema = get_schema(header for _, header in result_columns)
+
+    def get_value(row, index):
+        if index in style_columns and index < len(row):
+            return request.style_map.get(get_cell_style(row[index]), None)
+        return get_cell_value(row, index)
+
+    matching_rows = []
+    for row in limit_rows(request, get_style_matching_rows(request)):
+        matching_rows.append(Record(schema, [get_value(row, index) for index, _ in result_columns]))
     return matching_rows
 
 def search_column(request: ColumnSearchRequest):
-    search_columns = request.search_enum.get_search_columns(request.search_by)
-
+    '''
+    Returns the first value of each row which contains query.
+    Expects rows_iter to yield the values of the searched columns of each row.
+    '''
     matching_rows = []
-    for row in request.rows_iter:
-        for column in search_columns:
-            cell_value = row[column].value
+    for row_values in request.rows_iter:
+        for cell_value in row_values:
             if cell_value is None:
                 continue # Don't insert no value cell into search result
             if request.query in cell_value:
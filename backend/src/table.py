@@ -0,0 +1,68 @@
+from collections import Counter
+from itertools import compress
+
+class ColumnsTable():
+    '''
+    Columnar snapshot of a sheet values: a list of values per column, and the row index
+    of each position in the columns. Counts and group-bys pass over whole columns, instead
+    of building a row per sheet row.
+
+    The snapshot is not updated by changes to the sheet, so it should be dropped by whoever changes the sheet.
+    '''
+    def __init__(self, headers, columns, row_indexes):
+        self.headers = headers
+        self.columns = columns
+        self.row_indexes = row_indexes
+
+    def column(self, header):
+        '''
+        Returns the values of the column of the given header. A missing column has no values.
+        '''
+        if header not in self.headers:
+            return [None] * len(self.row_indexes)
+        return self.columns[self.headers.index(header)]
+
+    def has_value(self, header):
+        '''
+        Returns a mask of the rows which hold a value in the column of the given header.
+        '''
+        return [value is not None for value in self.column(header)]
+
+    def is_empty(self, header):
+        '''
+        Returns a mask of the rows which hold no value in the column of the given header.
+        '''
+        return [value is None for value in self.column(header)]
+
+    def count(self, mask):
+        return sum(mask)
+
+    def values(self, header, mask):
+        '''
+        Returns the values of the column of the given header, in the rows of mask.
+        '''
+        return list(compress(self.column(header), mask))
+
+    def group_count(self, header, mask):
+        '''
+        Returns a dict which maps each value of the column of the given header
+        to the number of rows of mask holding it, in order of first appearance.
+        '''
+        return dict(Counter(compress(self.column(header), mask)))
+
+def and_masks(*masks):
+    '''
+    Returns a mask of the rows which are in all given masks.
+    '''
+    return [all(in_masks) for in_masks in zip(*masks)]
+
+def build_table(headers, rows_values, first_row, columns_num):
+    '''
+    Returns a ColumnsTable of the given rows values, first row in rows_values is row number first_row.
+    Short rows are filled with None up to columns_num columns.
+    '''
+    padding = (None,) * columns_num
+    rows = [(tuple(row_values) + padding)[:columns_num] for row_values in rows_values]
+    columns = [list(values) for values in zip(*rows)] if rows else [[] for _ in range(columns_num)]
+    row_indexes = list(range(first_row, first_row + len(rows)))
+    return ColumnsTable(headers, columns, row_indexes)
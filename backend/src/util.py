@@ -3,7 +3,7 @@ from openpyxl import load_workbook
 from os import makedirs, path, umask
 from uuid import uuid4
 
-from src.data import driver_prop
+from src.data import driver_prop, key_prop
 from src.results import driver_update_results
 
 def without_hyphen(string: str):
@@ -34,9 +34,28 @@ def create_folders_path(folders):
     finally:
         umask(original_umask)
 
+def scaled_progress(on_progress, start, end):
+    '''
+    Returns a progress callback which reports its fraction of work done as a
+    part of the start to end range of on_progress. Returns None if on_progress is None.
+    '''
+    if on_progress is None:
+        return None
+    return lambda fraction: on_progress(start + (end - start) * fraction)
+
 def unique_list(lst):
     return list(dict.fromkeys(lst))
 
+def index_records(records, prop=key_prop):
+    '''
+    Returns a dict which maps each value of prop to the first record holding it,
+    so records can be joined by prop without scanning them again.
+    '''
+    records_index = {}
+    for record in records:
+        records_index.setdefault(record.get(prop), record)
+    return records_index
+
 DRIVER_NAME_MIN_LENGTH = 2
 
 def validate_driver_name(driver_name):
@@ -65,25 +84,20 @@ empty_values = [None, ""]
 
 def get_driver_status(driver_name, managers):
     '''
+    Expects managers to be a ManagersIndex.
     If given driver has a manager, returns his name.
     If given driver should be print-ignored, returns "ignore".
     If no manager found, returns None.
     '''
-    for manager in managers:
-        if manager.get('print', None) == "ignore":
-            continue
-        for driver in manager['drivers']:
-            if driver_name == driver['name']:
-                if driver.get('print', None) == "ignore":
-                    return "ignore"
-                return manager['name']
-    return None
+    return managers.driver_status.get(driver_name, None)
 
 def sort_families_by_drivers(managers, families):
     '''
     Returns a tuple which contains three lists, generated out of given managers and families.
     This tuple is the result of the sorting phase, before the actual pdf build.
+    Families are grouped in a single pass, using the managers driver status table.
     '''
+    driver_status = managers.driver_status
     managers_families = defaultdict(lambda: defaultdict(list))
     non_managers_families = defaultdict(list)
     driverless_families = []
@@ -93,13 +107,11 @@ def sort_families_by_drivers(managers, families):
         if driver_name in empty_values:
             driverless_families.append(family)
 
-        driver_status = get_driver_status(driver_name, managers)
-        if driver_status == "ignore":
-            continue
-        elif driver_status is None:
+        status = driver_status.get(driver_name, None)
+        if status is None:
             non_managers_families[driver_name].append(family)
-        else:
-            managers_families[driver_status][driver_name].append(family)
+        elif status != "ignore":
+            managers_families[status][driver_name].append(family)
     
     return managers_families, non_managers_families, driverless_families
 
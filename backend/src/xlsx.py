@@ -0,0 +1,320 @@
+import pickle
+from collections import namedtuple
+from hashlib import sha256
+from io import BytesIO
+from os import path, remove, replace
+from time import time_ns
+from posixpath import dirname, join, normpath
+from xml.etree.ElementTree import iterparse, fromstring
+from zipfile import ZipFile
+
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format
+from openpyxl.utils.cell import coordinate_to_tuple, range_boundaries
+from openpyxl.utils.datetime import from_excel, from_ISO8601, WINDOWS_EPOCH, MAC_EPOCH
+
+from src.cache import get_file_stamp
+from src.data import system_files_folder
+from src.util import create_folders_path, generate_random_id
+
+main_ns = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+relationships_ns = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+package_relationships_ns = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+custom_properties_ns = "{http://schemas.openxmlformats.org/officeDocument/2006/custom-properties}"
+variant_types_ns = "{http://schemas.openxmlformats.org/officeDocument/2006/docPropsVTypes}"
+
+workbook_path = "xl/workbook.xml"
+custom_properties_path = "docProps/custom.xml"
+
+sheets_cache_dir = f"{system_files_folder}/.cache/xlsx"
+sheets_cache_version = 1
+stamp_settle_time = 2 * 10**9 # Nanoseconds, longer than file systems modification time granularity
+
+XlsxCell = namedtuple("XlsxCell", ["value", "style"])
+'''
+A single cell value and its named style, which rows of XlsxSheet hold instead of openpyxl cells.
+'''
+
+empty_cell = XlsxCell(None, None)
+
+class XlsxSheet():
+    '''
+    First sheet of an xlsx file, parsed straight out of its xml without creating openpyxl cells.
+    Supports reading values and named styles of cells, like a read-only openpyxl worksheet.
+    '''
+    def __init__(self, rows, max_row, max_column, custom_properties):
+        self.sheet_rows = rows
+        self.max_row = max_row
+        self.max_column = max_column
+        self.custom_properties = custom_properties
+
+    @property
+    def rows(self):
+        return self.iter_rows()
+
+    def iter_rows(self, min_row=1, values_only=False):
+        '''
+        Yields a tuple of cells for each row from min_row up to max_row, all rows are max_column cells long.
+        If values_only is True, yields a tuple of values instead.
+        '''
+        empty_row = (None if values_only else empty_cell,) * self.max_column
+        for row_index in range(min_row, self.max_row + 1):
+            row = self.sheet_rows.get(row_index)
+            if row is None:
+                yield empty_row
+            elif values_only:
+                yield tuple(cell.value for cell in row)
+            else:
+                yield row
+
+def read_xlsx(data: bytes):
+    '''
+    Returns an XlsxSheet of the first sheet in the given xlsx file data.
+    '''
+    with ZipFile(BytesIO(data)) as archive:
+        names = set(archive.namelist())
+        workbook = fromstring(archive.read(workbook_path))
+        parts = get_parts(archive, workbook_path)
+
+        sheet = workbook.find(f"{main_ns}sheets/{main_ns}sheet")
+        sheet_path = parts[sheet.get(f"{relationships_ns}id")]
+        shared_strings = read_shared_strings(archive, parts.get("sharedStrings"))
+        styles, date_styles = read_styles(archive, parts.get("styles"))
+        properties = workbook.find(f"{main_ns}workbookPr")
+        is_1904 = properties is not None and properties.get("date1904") in ("1", "true")
+        epoch = MAC_EPOCH if is_1904 else WINDOWS_EPOCH
+
+        with archive.open(sheet_path) as sheet_file:
+            rows, max_row, max_column = read_rows(sheet_file, shared_strings, styles, date_styles, epoch)
+
+        custom_properties = {}
+        if custom_properties_path in names:
+            custom_properties = read_custom_properties(archive.read(custom_properties_path))
+
+    return XlsxSheet(rows, max_row, max_column, custom_properties)
+
+def read_xlsx_file(filename):
+    '''
+    Returns an XlsxSheet of the first sheet in the given xlsx file.
+
+    Parsed sheets are saved to a sidecar file in the cache folder, which is loaded instead
+    of parsing the file as long as the file content hash is unchanged. The hash isn't checked
+    again while the file stamp (modification time and size) is unchanged, unless the file was
+    modified too close to its last check to tell apart another modification in the same time.
+    The xlsx file is the source of truth, so a stale or unreadable sidecar is rebuilt.
+    '''
+    sidecar_filepath = get_sidecar_path(filename)
+    sidecar = read_sidecar(sidecar_filepath)
+    stamp = get_file_stamp(filename)
+    if sidecar is not None and sidecar["stamp"] == stamp and is_settled(stamp, sidecar["checked"]):
+        return XlsxSheet(**sidecar["sheet"])
+
+    checked = time_ns()
+    with open(filename, 'rb') as file:
+        data = file.read()
+    content_hash = sha256(data).hexdigest()
+    if sidecar is None or sidecar["hash"] != content_hash:
+        sheet = read_xlsx(data)
+        sidecar = {
+            "version": sheets_cache_version,
+            "hash": content_hash,
+            "sheet": {
+                "rows": sheet.sheet_rows,
+                "max_row": sheet.max_row,
+                "max_column": sheet.max_column,
+                "custom_properties": sheet.custom_properties,
+            },
+        }
+
+    sidecar["stamp"] = stamp
+    sidecar["checked"] = checked
+    write_sidecar(sidecar_filepath, sidecar)
+    return XlsxSheet(**sidecar["sheet"])
+
+def is_settled(stamp, checked):
+    '''
+    Returns whether a file of the given stamp was checked long enough after its modification,
+    that any later modification would change its modification time.
+    '''
+    _, modified, _ = stamp
+    return checked - modified > stamp_settle_time
+
+def get_sidecar_path(filename):
+    filename_hash = sha256(path.abspath(filename).encode('utf-8')).hexdigest()
+    return f"{sheets_cache_dir}/{filename_hash}.pickle"
+
+def read_sidecar(sidecar_filepath):
+    try:
+        with open(sidecar_filepath, 'rb') as file:
+            sidecar = pickle.load(file)
+    except Exception:
+        return None # Missing, partially written or of an older code
+    if not isinstance(sidecar, dict) or sidecar.get("version") != sheets_cache_version:
+        return None
+    return sidecar
+
+def write_sidecar(sidecar_filepath, sidecar):
+    '''
+    Writes the sidecar in a single replace, so concurrent readers never see a partial sidecar.
+    A failed write only means the file will be parsed again next time.
+    '''
+    temp_filepath = f"{sidecar_filepath}.{generate_random_id()}.tmp"
+    try:
+        create_folders_path(sheets_cache_dir)
+        with open(temp_filepath, 'wb') as file:
+            pickle.dump(sidecar, file, protocol=pickle.HIGHEST_PROTOCOL)
+        replace(temp_filepath, sidecar_filepath)
+    except OSError:
+        if path.exists(temp_filepath):
+            remove(temp_filepath)
+
+def get_parts(archive: ZipFile, part_path):
+    '''
+    Returns the paths of the parts related to the given part, by relationship id and by relationship type name.
+    '''
+    rels_path = join(dirname(part_path), "_rels", f"{part_path.rsplit('/', 1)[-1]}.rels")
+    parts = {}
+    for relationship in fromstring(archive.read(rels_path)).iter(f"{package_relationships_ns}Relationship"):
+        target = relationship.get("Target")
+        target_path = target.lstrip("/") if target.startswith("/") else normpath(join(dirname(part_path), target))
+        parts[relationship.get("Id")] = target_path
+        parts.setdefault(relationship.get("Type").rsplit("/", 1)[-1], target_path)
+    return parts
+
+def get_text(element):
+    '''
+    Returns the text of a string item, joining its rich text runs and skipping its phonetic hints.
+    '''
+    text = element.findtext(f"{main_ns}t")
+    if text is not None:
+        return text
+    return "".join(run.findtext(f"{main_ns}t", "") for run in element.iter(f"{main_ns}r"))
+
+def read_shared_strings(archive: ZipFile, strings_path):
+    if strings_path is None:
+        return []
+    strings = []
+    with archive.open(strings_path) as strings_file:
+        for _, element in iterparse(strings_file):
+            if element.tag == f"{main_ns}si":
+                strings.append(get_text(element))
+                element.clear()
+    return strings
+
+def read_styles(archive: ZipFile, styles_path):
+    '''
+    Returns a list of the named style of each cell style index,
+    and the set of cell style indexes which format numbers as dates.
+    '''
+    if styles_path is None:
+        return [], set()
+    stylesheet = fromstring(archive.read(styles_path))
+
+    number_formats = dict(BUILTIN_FORMATS)
+    for number_format in stylesheet.iterfind(f"{main_ns}numFmts/{main_ns}numFmt"):
+        number_formats[int(number_format.get("numFmtId"))] = number_format.get("formatCode")
+
+    named_styles = {}
+    for cell_style in stylesheet.iterfind(f"{main_ns}cellStyles/{main_ns}cellStyle"):
+        named_styles.setdefault(int(cell_style.get("xfId", 0)), cell_style.get("name"))
+
+    styles = []
+    date_styles = set()
+    for style_index, xf in enumerate(stylesheet.iterfind(f"{main_ns}cellXfs/{main_ns}xf")):
+        styles.append(named_styles.get(int(xf.get("xfId", 0))))
+        number_format = number_formats.get(int(xf.get("numFmtId", 0)))
+        if number_format is not None and is_date_format(number_format):
+            date_styles.add(style_index)
+    return styles, date_styles
+
+def to_number(value):
+    if "." in value or "E" in value or "e" in value:
+        return float(value)
+    return int(value)
+
+def read_cell_value(element, data_type, style_index, shared_strings, date_styles, epoch):
+    '''
+    Returns the value of a cell element, converted the same way openpyxl converts it.
+    '''
+    formula = element.find(f"{main_ns}f")
+    if formula is not None:
+        return f"={formula.text}" if formula.text else element.findtext(f"{main_ns}v")
+
+    if data_type == "inlineStr":
+        inline_string = element.find(f"{main_ns}is")
+        return None if inline_string is None else get_text(inline_string)
+
+    value = element.findtext(f"{main_ns}v") or None
+    if value is None:
+        return None
+
+    match data_type:
+        case "n":
+            value = to_number(value)
+            if style_index in date_styles:
+                value = from_excel(value, epoch)
+            return value
+        case "s":
+            return shared_strings[int(value)]
+        case "b":
+            return bool(int(value))
+        case "d":
+            return from_ISO8601(value)
+        case _:
+            return value
+
+def read_rows(sheet_file, shared_strings, styles, date_styles, epoch):
+    '''
+    Returns a dict of the cells of each row which has cells, and the sheet max row and max column.
+    The sheet dimension is included when present, same as openpyxl does.
+    '''
+    rows = {}
+    max_row = max_column = 0
+    dimension = None
+    row_index = 0
+    row_cells = {}
+    column = 0
+
+    for event, element in iterparse(sheet_file, events=("start", "end")):
+        tag = element.tag
+        if event == "start":
+            if tag == f"{main_ns}row":
+                row_index = int(element.get("r", row_index + 1))
+                row_cells = {}
+                column = 0
+            continue
+
+        if tag == f"{main_ns}c":
+            coordinate = element.get("r")
+            column = coordinate_to_tuple(coordinate)[1] if coordinate else column + 1
+            style_index = int(element.get("s", 0))
+            value = read_cell_value(element, element.get("t", "n"), style_index, shared_strings, date_styles, epoch)
+            style = styles[style_index] if style_index < len(styles) else None
+            row_cells[column] = XlsxCell(value, style)
+            element.clear()
+        elif tag == f"{main_ns}row":
+            if row_cells:
+                rows[row_index] = row_cells
+                max_row = max(max_row, row_index)
+                max_column = max(max_column, max(row_cells))
+            element.clear()
+        elif tag == f"{main_ns}dimension":
+            dimension = element.get("ref")
+
+    if dimension is not None:
+        _, _, dimension_column, dimension_row = range_boundaries(dimension)
+        max_row, max_column = max(max_row, dimension_row or 0), max(max_column, dimension_column or 0)
+
+    for row_index, row_cells in rows.items():
+        rows[row_index] = tuple(row_cells.get(column, empty_cell) for column in range(1, max_column + 1))
+    return rows, max_row, max_column
+
+def read_custom_properties(data: bytes):
+    '''
+    Returns a dict of the boolean custom document properties.
+    '''
+    properties = {}
+    for custom_property in fromstring(data).iter(f"{custom_properties_ns}property"):
+        value = custom_property.findtext(f"{variant_types_ns}bool")
+        if value is not None:
+            properties[custom_property.get("name")] = value in ("1", "true")
+    return properties
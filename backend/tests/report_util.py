@@ -4,8 +4,8 @@ from src.month import generate_month_files, load_month_report, month_reports_fol
 from src.pdf import print_dir_name
 from tests.families_util import write_families
 
-def load_report(name):
-    error, report_file = load_month_report(name)
+def load_report(name, read_only=False):
+    error, report_file = load_month_report(name, read_only)
     if error is not None:
         raise Exception("Couldn't load report file", error)
     else:
@@ -1,13 +1,17 @@
 import unittest
+from openpyxl import load_workbook
+from os import listdir, path
+from threading import Event, Thread
 
-from src.data import driver_prop
+from src.cache import files_cache
+from src.data import driver_prop, families_filename
 from src.drivers import get_driver_families
-from src.families import get_count, search_families, add_family, add_families, update_family, remove_family, restore_family, FamiliesSearchBy, remove_driver, remove_many_drivers, add_driver
+from src.families import load_families_file, permanent_remove_family, get_count, search_families, search_families_page, add_family, add_families, update_family, remove_family, restore_family, FamiliesSearchBy, remove_driver, remove_many_drivers, add_driver
 from src.results import add_results, add_many_results, add_many_error
-from src.errors import FamilyNotFoundError
+from src.errors import FamilyNotFoundError, ReadOnlyFileError
 from src.search import find, FindRequest
 
-from tests.families_util import Family, HistoryFamily, write_families, write_history_families, empty_families, empty_families_history, setUpFamilies, tearDownFamilies
+from tests.families_util import Family, HistoryFamily, write_families, write_history_families, empty_families, empty_families_history, setUpFamilies, tearDownFamilies, load_families
 
 class TestSearch(unittest.TestCase):
     def setUpClass():
@@ -167,6 +171,58 @@ class TestSearch(unittest.TestCase):
                 search_result = search_families(families_file, query, exact=exact)
                 self.assertEqual(expected_len, len(search_result), message)
 
+    def test_search_page(self):
+        names = ["פרינץ", "כהנא", "נתאי", "שלום", "חיים"]
+        families_file = write_families([Family({"שם מלא": name}) for name in names])
+
+        test_cases = [
+            (None, 2, names,                     "Should page through all families"),
+            ("י",  1, ["פרינץ", "נתאי", "חיים"], "Should page through matching families only"),
+            ("י",  5, ["פרינץ", "נתאי", "חיים"], "Should return all matching families in a single page"),
+            ("אבג", 2, [],                       "Should return an empty page when no families found"),
+        ]
+
+        for query, limit, expected_names, message in test_cases:
+            with self.subTest(self.get_title(query), limit=limit):
+                actual_names = []
+                cursor = None
+                while True:
+                    page = search_families_page(families_file, query, limit=limit, cursor=cursor, with_total=True)
+                    self.assertLessEqual(len(page.results), limit, "Should not return more than limit families")
+                    self.assertEqual(page.total, len(expected_names), "Should count all matching families")
+                    actual_names += [family["שם מלא"] for family in page.results]
+                    cursor = page.next_cursor
+                    if cursor is None:
+                        break
+                self.assertEqual(actual_names, expected_names, message)
+
+    def test_search_fields(self):
+        families_file = write_families([Family({"שם מלא": "פרינץ", "נהג": "שלום"})])
+
+        test_cases = [
+            (None,                ["שם מלא", "רחוב", "בניין", "דירה", "קומה", "מס' בית", "מס' פלאפון", "נהג", "ממליץ", "הערות"], "Should return all fields by default"),
+            (["נהג", "שם מלא"],   ["שם מלא", "נהג"], "Should return requested fields only, in sheet order"),
+            (["לא קיים"],         [], "Should ignore unknown fields"),
+        ]
+
+        for fields, expected_keys, message in test_cases:
+            with self.subTest(fields=fields):
+                families = search_families(families_file, fields=fields)
+                self.assertEqual(list(families[0].keys()), expected_keys, message)
+
+    def test_search_page_without_limit(self):
+        families_file = write_families([Family({"שם מלא": name}) for name in ["פרינץ", "כהנא"]])
+        page = search_families_page(families_file)
+        self.assertEqual(len(page.results), 2, "Should return all families without limit")
+        self.assertIsNone(page.next_cursor, "Should not return cursor without limit")
+        self.assertIsNone(page.total, "Should not count families unless requested")
+
+    def test_search_page_zero_limit(self):
+        families_file = write_families([Family({"שם מלא": name}) for name in ["פרינץ", "כהנא"]])
+        page = search_families_page(families_file, limit=0, with_total=True)
+        self.assertEqual(page.results, [], "Should not return families past a limit of 0")
+        self.assertEqual(page.total, 2, "Should count all families regardless of limit")
+
 class TestFind(unittest.TestCase):
     def setUpClass():
         setUpFamilies()
@@ -198,6 +254,69 @@ class TestFind(unittest.TestCase):
                 find_result = find(request)
                 self.assertEqual(expected_index, find_result, message)
 
+class TestRowIndex(unittest.TestCase):
+    def setUpClass():
+        setUpFamilies()
+    
+    def tearDownClass():
+        tearDownFamilies()
+
+    def assertRowIndexes(self, families_file, names):
+        for expected_index, name in enumerate(names, families_file.first_content_row):
+            self.assertEqual(expected_index, families_file.get_row_index(name), f"Should find {name} in its row")
+
+    def test_row_index_after_changes(self):
+        names = ["פרינץ", "כהנא", "נתאי"]
+        families_file = write_families([Family({"שם מלא": name}) for name in names])
+        self.assertRowIndexes(families_file, names)
+
+        add_family(families_file, {"שם מלא": "שלום"})
+        self.assertRowIndexes(families_file, ["פרינץ", "כהנא", "נתאי", "שלום"])
+
+        permanent_remove_family(families_file, "כהנא")
+        self.assertRowIndexes(families_file, ["פרינץ", "נתאי", "שלום"])
+        self.assertRaises(FamilyNotFoundError, families_file.get_row_index, "כהנא")
+
+        update_family(families_file, "נתאי", {"שם מלא": "חיים"})
+        self.assertRowIndexes(families_file, ["פרינץ", "חיים", "שלום"])
+        self.assertRaises(FamilyNotFoundError, families_file.get_row_index, "נתאי")
+
+    def test_row_index_duplicate_names(self):
+        families_file = write_families([Family({"שם מלא": name}) for name in ["פרינץ", "שלום", "פרינץ"]])
+        self.assertEqual(2, families_file.get_row_index("פרינץ"), "Should find first row of a duplicate name")
+
+        permanent_remove_family(families_file, "פרינץ")
+        self.assertEqual(3, families_file.get_row_index("פרינץ"), "Should find remaining row of a duplicate name")
+
+    def test_search_index_after_changes(self):
+        families_file = write_families([Family({"שם מלא": "פרינץ", "רחוב": "הבנים", "מס' פלאפון": "052-1111111"})])
+        self.assertEqual(1, len(search_families(families_file, "בנ", 'street')), "Should find family by street")
+
+        add_family(families_file, {"שם מלא": "שלום", "רחוב": "הבנאים", "מס' פלאפון": "0532222222"})
+        self.assertEqual(2, len(search_families(families_file, "בנ", 'street')), "Should find added family by street")
+        self.assertEqual(1, len(search_families(families_file, "0532", 'phone')), "Should find added family by phone")
+
+        update_family(families_file, "פרינץ", {"רחוב": "השופטים"})
+        self.assertEqual(1, len(search_families(families_file, "בנ", 'street')), "Should not find family by its old street")
+        self.assertEqual(1, len(search_families(families_file, "שופט", 'street')), "Should find family by its new street")
+
+        permanent_remove_family(families_file, "פרינץ")
+        self.assertEqual(0, len(search_families(families_file, "שופט", 'street')), "Should not find removed family")
+        self.assertEqual("שלום", search_families(families_file, "בנ", 'street')[0]["שם מלא"], "Should find moved up family")
+
+    def test_columns_table_after_changes(self):
+        families_file = write_families([Family({"שם מלא": "פרינץ", "נהג": "ארז"})])
+        self.assertEqual(["ארז"], families_file.get_columns_table().column(driver_prop), "Should snapshot column values")
+
+        add_family(families_file, {"שם מלא": "שלום", "נהג": "דוד"})
+        update_family(families_file, "פרינץ", {"נהג": "משה"})
+        self.assertEqual(["משה", "דוד"], families_file.get_columns_table().column(driver_prop), "Should snapshot changed values")
+
+        permanent_remove_family(families_file, "פרינץ")
+        table = families_file.get_columns_table()
+        self.assertEqual(["דוד"], table.column(driver_prop), "Should not snapshot removed rows")
+        self.assertEqual([2], table.row_indexes, "Should snapshot moved up row indexes")
+
 class TestDataManagement(unittest.TestCase):
     def setUpClass():
         setUpFamilies()
@@ -248,7 +367,7 @@ class TestDataManagement(unittest.TestCase):
         for families, expected_result, message in test_cases:
             with self.subTest(expected_result.title):
                 families_file = write_families(families=exist_families)
-                result = add_families(families_file, families)
+                result, _ = add_families(families_file, families)
                 self.assertEqual(expected_result, result, message)
 
     def test_add_families_before_error(self):
@@ -257,7 +376,7 @@ class TestDataManagement(unittest.TestCase):
         families_file = write_families(families=exist_families)
         
         families = [{"שם מלא": "דוד חיים"}, {"שם מלא": "משפוחה"}, {"שם מלא": "שלום פרינץ"}]
-        result = add_families(families_file, families)
+        result, _ = add_families(families_file, families)
         
         exists_error = add_many_error(add_results["FAMILY_EXISTS"], family["שם מלא"])
         self.assertEqual(exists_error, result, "Should return 'Family Exists' result")
@@ -267,6 +386,23 @@ class TestDataManagement(unittest.TestCase):
         second = search_families(families_file, "משפוחה", 'name')
         self.assertEqual(1, len(second), "Should add second family before error")
 
+    def test_add_families_continues_after_error(self):
+        families_file = write_families([Family({"שם מלא": "שלום פרינץ"})])
+
+        families = [{"שם מלא": "שלום פרינץ"}, {"שם מלא": "דוד"}, {"שם מלא": "דוד"}, {"שם מלא": "חיים", "מס' בית": "123"}, {"שם מלא": "משה"}]
+        result, added_families = add_families(families_file, families)
+
+        expected_errors = [
+            add_many_error(add_results["FAMILY_EXISTS"], "שלום פרינץ"),
+            add_many_error(add_results["FAMILY_EXISTS"], "דוד"),
+            add_many_error(add_results["PHONE_WRONG_LEN"], "חיים"),
+        ]
+        self.assertEqual(expected_errors[0], result, "Should return first family error")
+        self.assertEqual(expected_errors, result.errors, "Should list all families errors, including duplicates in given families")
+        self.assertEqual(3, get_count(families_file), "Should add all valid families")
+        self.assertEqual(1, len(search_families(families_file, "דוד", exact=True)), "Should add a duplicated family once")
+        self.assertEqual(["דוד", "משה"], [family["שם מלא"] for family in added_families], "Should return only added families")
+
     def test_update_family(self):
         updated_family = {"שם מלא": "שם חדש"}
         families = [{"שם מלא": ""}, {"שם מלא": None}, {"שם מלא": "שלום פרינץ"}, {"שם מלא": "נתאי"}, {"שם מלא": "חיים"}]
@@ -407,3 +543,147 @@ class TestFamiliesHistory(unittest.TestCase):
                 actual_families_count = get_count(families_file)
                 self.assertEqual(expected_history_count, actual_history_count, message)
                 self.assertEqual(expected_families_count, actual_families_count, message)
+
+class TestFamiliesCache(unittest.TestCase):
+    def setUpClass():
+        setUpFamilies()
+    
+    def tearDownClass():
+        tearDownFamilies()
+
+    def test_unchanged_file_cached(self):
+        families_file = write_families([Family({"שם מלא": "פרינץ"})])
+        self.assertIs(families_file, load_families(), "Should reuse loaded file while it is unchanged")
+
+    def test_external_change_reloads(self):
+        families_file = write_families([Family({"שם מלא": "פרינץ"})])
+        reloaded_file = write_families([Family({"שם מלא": "פרינץ"}), Family({"שם מלא": "שלום"})])
+        self.assertIsNot(families_file, reloaded_file, "Should reload file after it was changed by someone else")
+        self.assertEqual(2, get_count(reloaded_file), "Should load the changed file contents")
+
+    def test_own_save_reloads(self):
+        families_file = write_families([Family({"שם מלא": "פרינץ", "נהג": "ארז"})])
+        add_family(families_file, {"שם מלא": "שלום"})
+        remove_driver(families_file, "פרינץ")
+
+        reloaded_file = load_families()
+        self.assertIsNot(families_file, reloaded_file, "Should load saved file again instead of reusing changed file")
+        self.assertEqual(2, get_count(reloaded_file), "Should contain saved changes")
+        self.assertEqual(
+            search_families(reloaded_file, "פרינץ", "name")[0][driver_prop],
+            search_families(load_families_file(read_only=True)[1], "פרינץ", "name")[0][driver_prop],
+            "Should load the same values as a read-only load")
+
+    def test_failed_save_not_cached(self):
+        families_file = write_families([Family({"שם מלא": "פרינץ"})])
+        def failing_save(filename):
+            raise OSError("Failed saving")
+        families_file.workbook.save = failing_save
+
+        with self.assertRaises(OSError):
+            add_family(families_file, {"שם מלא": "שלום"})
+        reloaded_file = load_families()
+        self.assertIsNot(families_file, reloaded_file, "Should not reuse file with unsaved changes")
+        self.assertEqual(1, get_count(reloaded_file), "Should not contain unsaved changes")
+
+    def test_save_replaces_whole_file(self):
+        families_file = write_families([Family({"שם מלא": "פרינץ"})])
+        read_counts = []
+        original_save = families_file.workbook.save
+        def save_and_read(filename):
+            original_save(filename)
+            read_counts.append(get_count(load_families_file(read_only=True)[1]))
+        families_file.workbook.save = save_and_read
+
+        add_family(families_file, {"שם מלא": "שלום"})
+        self.assertEqual(read_counts, [1], "Should read the whole previous file while saving")
+        self.assertEqual(2, get_count(load_families_file(read_only=True)[1]), "Should read the whole saved file once saved")
+        temp_files = [filename for filename in listdir(path.dirname(families_filename)) if filename.endswith(".tmp")]
+        self.assertEqual(temp_files, [], "Should not leave temporary files")
+
+    def test_writable_file_held(self):
+        write_families([Family({"שם מלא": "פרינץ"})])
+        loaded = Event()
+        def load_in_other_thread():
+            load_families()
+            files_cache.release_held()
+            loaded.set()
+
+        other_thread = Thread(target=load_in_other_thread)
+        other_thread.start()
+        self.assertFalse(loaded.wait(0.2), "Should not load writable file held by another thread")
+
+        files_cache.release_held()
+        other_thread.join()
+        self.assertTrue(loaded.is_set(), "Should load writable file once it is released")
+
+class TestReadOnlyFamilies(unittest.TestCase):
+    def setUpClass():
+        setUpFamilies()
+    
+    def tearDownClass():
+        tearDownFamilies()
+
+    def load_read_only(self):
+        error, families_file = load_families_file(read_only=True)
+        self.assertIsNone(error, "Failed loading read-only families file")
+        return families_file
+
+    def test_read_only_queries(self):
+        families = [Family({"שם מלא": "פרינץ", "נהג": "ארז"}),
+            Family({"שם מלא": "כהנא", "נהג": "ארז"}),
+            Family({"שם מלא": "נתאי", "נהג": None})]
+        families_file = write_families(families)
+        read_only_file = self.load_read_only()
+
+        self.assertEqual(get_count(families_file), get_count(read_only_file), "Should count the same families")
+        self.assertEqual(search_families(families_file), search_families(read_only_file), "Should find the same families")
+        self.assertEqual(families_file.get_row_index("נתאי"), read_only_file.get_row_index("נתאי"), "Should find the same row")
+        self.assertEqual(
+            families_file.column_search("", "driver"),
+            read_only_file.column_search("", "driver"),
+            "Should search the same column values")
+
+    def test_read_only_refuses_writes(self):
+        write_families([Family({"שם מלא": "פרינץ"})])
+        read_only_file = self.load_read_only()
+
+        with self.assertRaises(ReadOnlyFileError):
+            add_family(read_only_file, {"שם מלא": "שלום"})
+        with self.assertRaises(ReadOnlyFileError):
+            remove_driver(read_only_file, "פרינץ")
+        self.assertEqual(1, get_count(load_families()), "Should not change the file")
+
+class TestBatchChanges(unittest.TestCase):
+    def setUpClass():
+        setUpFamilies()
+    
+    def tearDownClass():
+        tearDownFamilies()
+
+    def get_saved_rows_num(self):
+        workbook = load_workbook(families_filename)
+        return workbook[workbook.sheetnames[0]].max_row
+
+    def test_batch_saves_once_on_exit(self):
+        families_file = write_families([Family({"שם מלא": "פרינץ"})])
+        saved_rows = self.get_saved_rows_num()
+
+        with families_file.batch():
+            add_family(families_file, {"שם מלא": "שלום"})
+            add_family(families_file, {"שם מלא": "נתאי"})
+            self.assertEqual(saved_rows, self.get_saved_rows_num(), "Should not save changes inside a batch")
+            self.assertEqual(3, get_count(families_file), "Should apply changes inside a batch")
+
+        self.assertEqual(saved_rows + 2, self.get_saved_rows_num(), "Should save all changes when batch ends")
+
+    def test_nested_batch(self):
+        families_file = write_families([Family({"שם מלא": "פרינץ"})])
+        saved_rows = self.get_saved_rows_num()
+
+        with families_file.batch():
+            with families_file.batch():
+                add_family(families_file, {"שם מלא": "שלום"})
+            self.assertEqual(saved_rows, self.get_saved_rows_num(), "Should save on outermost batch exit only")
+
+        self.assertEqual(saved_rows + 1, self.get_saved_rows_num(), "Should save changes of nested batch")
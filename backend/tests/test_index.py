@@ -0,0 +1,25 @@
+import unittest
+from threading import Barrier, Thread
+
+from src.index import ColumnIndex
+
+class TestColumnIndex(unittest.TestCase):
+    def test_concurrent_first_contains(self):
+        values = [f"משפחה {i}" for i in range(20000)]
+        expected_rows = [row_index for row_index, value in enumerate(values, 2) if "1234" in value]
+        index = ColumnIndex(0).build(values, range(2, len(values) + 2))
+
+        threads_count = 8
+        barrier = Barrier(threads_count)
+        results = []
+        def lookup():
+            barrier.wait()
+            results.append(index.contains("1234"))
+
+        threads = [Thread(target=lookup) for _ in range(threads_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [expected_rows] * threads_count, "Should find all rows while lookup grams are built")
@@ -0,0 +1,125 @@
+import unittest
+from os import utime
+from shutil import rmtree
+from threading import Event
+from time import sleep, time
+
+from src.errors import FileAlreadyExists
+from src.jobs import JobsQueue, JobStatus
+
+temp_jobs_folder = "system_files/temp_jobs"
+
+def wait_for_jobs(jobs_queue):
+    jobs_queue.executor.shutdown(wait=True)
+
+class TestJobs(unittest.TestCase):
+    def setUp(self):
+        self.jobs_queue = JobsQueue(temp_jobs_folder)
+
+    def tearDown(self):
+        wait_for_jobs(self.jobs_queue)
+        rmtree(temp_jobs_folder, ignore_errors=True)
+
+    def test_job_done(self):
+        progress_values = []
+        def target(value, on_progress):
+            on_progress(0.5)
+            progress_values.append(value)
+
+        job_id = self.jobs_queue.submit("test", target, "value")
+        wait_for_jobs(self.jobs_queue)
+
+        error, job = self.jobs_queue.get(job_id)
+        self.assertIsNone(error)
+        self.assertEqual(job["status"], JobStatus.DONE, "Should mark finished job as done")
+        self.assertEqual(job["progress"], 100, "Should complete progress of finished job")
+        self.assertEqual(progress_values, ["value"], "Should run job target with given args")
+
+    def test_job_failed(self):
+        test_cases = [
+            (lambda on_progress: FileAlreadyExists("קיים"), "File Already Exists", "Should fail job with returned error"),
+            (lambda on_progress: 1 / 0, "Internal Server Error", "Should fail job with raised exception"),
+        ]
+
+        jobs_ids = [self.jobs_queue.submit("test", target) for target, _, _ in test_cases]
+        wait_for_jobs(self.jobs_queue)
+
+        for job_id, (_, expected_title, message) in zip(jobs_ids, test_cases):
+            with self.subTest(expected_title):
+                error, job = self.jobs_queue.get(job_id)
+                self.assertIsNone(error)
+                self.assertEqual(job["status"], JobStatus.FAILED, message)
+                self.assertEqual(job["error"]["title"], expected_title, message)
+
+    def test_job_progress(self):
+        progress_set = Event()
+        finish = Event()
+        def target(on_progress):
+            on_progress(0.42)
+            progress_set.set()
+            finish.wait()
+
+        job_id = self.jobs_queue.submit("test", target)
+        progress_set.wait()
+
+        error, job = self.jobs_queue.get(job_id)
+        finish.set()
+        self.assertIsNone(error)
+        self.assertEqual(job["status"], JobStatus.RUNNING, "Should mark started job as running")
+        self.assertEqual(job["progress"], 42, "Should report job progress in percents")
+
+    def test_job_persisted(self):
+        job_id = self.jobs_queue.submit("test", lambda on_progress: None)
+        wait_for_jobs(self.jobs_queue)
+
+        error, job = JobsQueue(temp_jobs_folder).get(job_id)
+        self.assertIsNone(error)
+        self.assertEqual(job["status"], JobStatus.DONE, "Should load job status from disk")
+
+    def test_interrupted_job(self):
+        finish = Event()
+        job_id = self.jobs_queue.submit("test", lambda on_progress: finish.wait())
+
+        error, job = JobsQueue(temp_jobs_folder).get(job_id)
+        finish.set()
+        self.assertIsNone(error)
+        self.assertEqual(job["status"], JobStatus.INTERRUPTED, "Should mark active jobs of other runs as interrupted")
+
+    def test_old_jobs_pruned(self):
+        previous_run_jobs_queue = JobsQueue(temp_jobs_folder)
+        previous_run_job_id = previous_run_jobs_queue.submit("test", lambda on_progress: None)
+        wait_for_jobs(previous_run_jobs_queue)
+
+        jobs_queue = JobsQueue(temp_jobs_folder, max_age=60)
+        finished_job_id = jobs_queue.submit("test", lambda on_progress: None)
+        while jobs_queue.get(finished_job_id)[1]["status"] != JobStatus.DONE:
+            sleep(0.01)
+        finish = Event()
+        active_job_id = jobs_queue.submit("test", lambda on_progress: finish.wait())
+
+        old_time = time() - 120
+        for job_id in [finished_job_id, active_job_id, previous_run_job_id]:
+            jobs_queue.jobs.get(job_id, {})["updated"] = old_time
+            utime(jobs_queue.get_job_path(job_id), (old_time, old_time))
+
+        new_job_id = jobs_queue.submit("test", lambda on_progress: None)
+        finish.set()
+        wait_for_jobs(jobs_queue)
+
+        test_cases = [
+            (finished_job_id, False, "Should prune old finished jobs"),
+            (previous_run_job_id, False, "Should prune old jobs of previous runs"),
+            (active_job_id, True, "Should not prune active jobs"),
+            (new_job_id, True, "Should not prune new jobs"),
+        ]
+        for job_id, is_kept, message in test_cases:
+            with self.subTest(message):
+                error, _ = jobs_queue.get(job_id)
+                self.assertEqual(error is None, is_kept, message)
+
+    def test_job_not_found(self):
+        for job_id in ["", "not-a-job", "../jobs"]:
+            with self.subTest(job_id):
+                error, job = self.jobs_queue.get(job_id)
+                self.assertIsNotNone(error, "Should return error for unknown job")
+                self.assertIsNone(job)
@@ -1,6 +1,8 @@
 import unittest
 
-from src.managers import get_managers, load_managers_file, find_manager, remove_manager, add_manager, get_managers_drivers
+from src.managers import get_managers, load_managers_file, load_managers_index, find_manager, remove_manager, add_manager, get_managers_drivers, get_drivers_diff
+from src.data import driver_prop
+from src.util import get_driver_status, get_all_pages
 
 from tests.managers_util import setUpManagers, tearDownManagers, write_managers
 
@@ -55,6 +57,50 @@ class TestManagersInfo(unittest.TestCase):
         drivers = get_managers_drivers(managers_file)
         self.assertEqual(["driver", "other"], drivers, "Should return all drivers")
 
+    def test_managers_index_updated(self):
+        managers_file = write_managers([{ "id": "0", "name": "שלום", "drivers": [{ "name": "פלוני" }] }])
+        self.assertEqual("שלום", find_manager(managers_file, "פלוני"), "Should find manager of driver")
+
+        managers_file.update_json([{ "id": "0", "name": "חיים", "drivers": [{ "name": "פלוני" }] }])
+        self.assertEqual("חיים", find_manager(managers_file, "פלוני"), "Should find manager of driver after managers file update")
+
+    def test_get_driver_status(self):
+        managers_file = write_managers([
+            { "id": "0", "name": "מודפס", "drivers": [{ "name": "פלוני" }, { "name": "אלמוני", "print": "ignore" }] },
+            { "id": "1", "name": "מוסתר", "print": "ignore", "drivers": [{ "name": "נסתר" }, { "name": "פלוני" }] },
+            { "id": "2", "name": "אחר", "drivers": [{ "name": "נסתר" }] },
+        ])
+        managers = load_managers_index(managers_file)
+
+        test_cases = [
+            ("פלוני",   "מודפס",  "Should return manager name of printed driver"),
+            ("אלמוני",  "ignore", "Should return ignore for print-ignored driver"),
+            ("נסתר",    "אחר",    "Should skip print-ignored managers"),
+            ("לא קיים", None,     "Should return None for driver without manager"),
+        ]
+
+        for driver, expected_status, message in test_cases:
+            with self.subTest(f"driver: {driver}"):
+                self.assertEqual(expected_status, get_driver_status(driver, managers), message)
+
+    def test_get_all_pages(self):
+        managers_file = write_managers([
+            { "id": "0", "name": "מנהל", "drivers": [{ "name": "נהג" }, { "name": "מוסתר", "print": "ignore" }] },
+        ])
+        managers = load_managers_index(managers_file)
+        families = [{ driver_prop: name } for name in ["נהג", "עצמאי", "מוסתר", "", "נהג"]]
+
+        actual_pages = [(page["title"], len(page.get("content", []))) for page in get_all_pages(managers, families)]
+        expected_pages = [("מנהל", 0), ("נהג", 2), ("עצמאי", 1), ("משפחות ללא נהג", 1)]
+        self.assertEqual(expected_pages, actual_pages, "Should group families by managers and drivers, in order")
+
+    def test_get_drivers_diff(self):
+        managers_file = write_managers([{ "id": "0", "name": "manager", "drivers": [
+            { "name": "first" }, { "name": "second" }, { "name": "third" }
+        ]}])
+        new_managers = [{ "id": "0", "name": "manager", "drivers": [{ "name": "second" }] }]
+        self.assertEqual(["first", "third"], get_drivers_diff(managers_file, new_managers), "Should return removed drivers")
+
 class TestManagersEdit(unittest.TestCase):
     def setUpClass():
         setUpManagers()
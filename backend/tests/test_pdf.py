@@ -0,0 +1,180 @@
+import unittest
+from concurrent.futures.process import BrokenProcessPool
+from os import listdir, path, remove, stat, _exit
+from pypdf import PdfReader
+from reportlab.pdfbase import pdfmetrics
+
+from src.data import pdf_properties, key_prop, driver_prop
+from src.pdf import PDFBuilder, get_pdf_pool, discard_pdf_pool, split_pages, pdf_hash_suffix, fragments_dir, to_hebrew, to_hebrew_row, get_bidi_cache_info
+
+from tests.tests_util import generate_random_name
+
+temp_pdf_filepath = "system_files/temp_pdf"
+
+def title_page(title):
+    return { "title": title }
+
+def driver_page(driver, families_count=1):
+    return { "title": driver, "content": [{ key_prop: f"{driver} {i}", driver_prop: driver } for i in range(families_count)] }
+
+class TestPDFBuilder(unittest.TestCase):
+    def tearDown(self):
+        for filepath in [temp_pdf_filepath, f"{temp_pdf_filepath}_fragments"]:
+            for suffix in [".pdf", pdf_hash_suffix]:
+                if path.exists(f"{filepath}{suffix}"):
+                    remove(f"{filepath}{suffix}")
+
+    def test_fonts_registered_once(self):
+        PDFBuilder("test", filepath=temp_pdf_filepath)
+        font = pdfmetrics.getFont("Hebrew")
+
+        PDFBuilder("test", filepath=temp_pdf_filepath)
+        self.assertIs(pdfmetrics.getFont("Hebrew"), font, "Should reuse fonts registered by previous builders")
+
+    def test_to_hebrew(self):
+        test_cases = [
+            (None, "", "Should convert None to empty text"),
+            ("", "", "Should convert empty text to empty text"),
+            (12, "12", "Should convert numbers to text"),
+            ("שלום 12", "12 םולש", "Should convert hebrew text to display order"),
+        ]
+
+        for text, expected, message in test_cases:
+            with self.subTest(message):
+                self.assertEqual(to_hebrew(text), expected, message)
+
+    def test_to_hebrew_memoized(self):
+        text = generate_random_name(8)
+        to_hebrew(text)
+        hits = get_bidi_cache_info().hits
+
+        self.assertEqual(to_hebrew_row([text, None, text]), [text, "", text], "Should convert all row values")
+        self.assertEqual(get_bidi_cache_info().hits, hits + 2, "Should reuse conversions of repeated texts")
+
+    def test_split_pages(self):
+        test_cases = [
+            ([], [], "Should not split empty pages"),
+            ([title_page("a"), driver_page("1"), driver_page("2"), title_page("b")],
+             [[title_page("a"), driver_page("1"), driver_page("2")], [title_page("b")]],
+             "Should split each title page and its pages to their own fragment"),
+            ([driver_page("1"), title_page("a"), driver_page("2"), title_page("b"), driver_page("3")],
+             [[driver_page("1"), title_page("a"), driver_page("2")], [title_page("b"), driver_page("3")]],
+             "Should not split before first title page, which doesn't break from previous pages"),
+        ]
+
+        for pages, expected_fragments, message in test_cases:
+            with self.subTest(message):
+                self.assertEqual(split_pages(pages), expected_fragments, message)
+
+    def test_build_multi_fragments(self):
+        test_cases = [
+            ("Should render the same pages in the same order", [title_page("אחראי"), driver_page("אחראי 1", 3)]),
+            ("Should render a changed page the same as a new build", [title_page("אחראי"), driver_page("אחראי 1", 4)]),
+            ("Should render pages without title pages the same", [driver_page("עצמאי"), driver_page("נהג", 50)]),
+        ]
+
+        common_pages = [title_page("מנהל"), driver_page("מנהל 1", 3), driver_page("מנהל 2", 50)]
+        for message, pages in test_cases:
+            with self.subTest(message):
+                pages = pages + common_pages
+                PDFBuilder("test", filepath=temp_pdf_filepath).build_multi(pages, pdf_properties)
+                PDFBuilder("test", filepath=f"{temp_pdf_filepath}_fragments").build_multi_fragments(pages, pdf_properties)
+
+                expected_pages = PdfReader(f"{temp_pdf_filepath}.pdf").pages
+                actual_pages = PdfReader(f"{temp_pdf_filepath}_fragments.pdf").pages
+                self.assertEqual(
+                    [page.extract_text() for page in actual_pages],
+                    [page.extract_text() for page in expected_pages],
+                    message)
+
+    def test_fragments_rendered_once(self):
+        pages = [title_page("מנהל"), driver_page(generate_random_name(), 2), title_page("מנהל 2"), driver_page(generate_random_name())]
+        PDFBuilder("test", filepath=temp_pdf_filepath).build_multi_fragments(pages, pdf_properties)
+        fragments_before = set(listdir(fragments_dir))
+
+        pages[1] = driver_page(pages[1]["title"], 3)
+        PDFBuilder("test", filepath=temp_pdf_filepath).build_multi_fragments(pages, pdf_properties)
+        new_fragments = set(listdir(fragments_dir)) - fragments_before
+        self.assertEqual(len(new_fragments), 1, "Should render only the changed part fragment")
+
+    def test_fragments_size_and_reuse(self):
+        pages = []
+        for manager in range(10):
+            pages.append(title_page(f"מנהל {manager}"))
+            pages += [driver_page(f"{generate_random_name()} {manager}", 8) for _ in range(10)]
+
+        PDFBuilder("test", filepath=temp_pdf_filepath).build_multi(pages, pdf_properties)
+        PDFBuilder("test", filepath=f"{temp_pdf_filepath}_fragments").build_multi_fragments(pages, pdf_properties)
+
+        single_pass_size = path.getsize(f"{temp_pdf_filepath}.pdf")
+        fragments_size = path.getsize(f"{temp_pdf_filepath}_fragments.pdf")
+        fonts_size = 25000 # Fonts subsets embedded once per fragment
+        self.assertLess(
+            fragments_size - single_pass_size,
+            len(split_pages(pages)) * fonts_size,
+            "Should not inflate document built out of fragments beyond their embedded fonts")
+
+        def get_fragments_inodes():
+            # Used fragments are touched, but rendered fragments replace their file
+            return { filename: stat(f"{fragments_dir}/{filename}").st_ino for filename in listdir(fragments_dir) }
+        fragments_before = get_fragments_inodes()
+
+        pages[1] = driver_page(pages[1]["title"], 9)
+        PDFBuilder("test", filepath=f"{temp_pdf_filepath}_fragments").build_multi_fragments(pages, pdf_properties)
+        fragments_after = get_fragments_inodes()
+        new_fragments = fragments_after.keys() - fragments_before.keys()
+        self.assertEqual(len(new_fragments), 1, "Should render only the fragment of the changed driver")
+        self.assertTrue(
+            all(fragments_after.get(filename) == inode for filename, inode in fragments_before.items()),
+            "Should reuse unchanged fragments without rendering them again")
+
+    def test_broken_pool_replaced(self):
+        broken_pool = get_pdf_pool()
+        with self.assertRaises(BrokenProcessPool):
+            broken_pool.submit(_exit, 1).result()
+
+        discard_pdf_pool(broken_pool)
+        pool = get_pdf_pool()
+        self.assertIsNot(pool, broken_pool, "Should start a new pool instead of a broken pool")
+        self.assertEqual(pool.submit(abs, -1).result(), 1, "Should run tasks in the new pool")
+        discard_pdf_pool(pool)
+
+    def test_unchanged_build_skipped(self):
+        pdf_filepath = f"{temp_pdf_filepath}.pdf"
+        pages = [title_page("מנהל"), driver_page("נהג")]
+
+        def build(pages, title="test"):
+            PDFBuilder(title, filepath=temp_pdf_filepath).build_multi(pages, pdf_properties)
+            return path.getmtime(pdf_filepath)
+
+        first_build_time = build(pages)
+        self.assertEqual(build(pages), first_build_time, "Should not rebuild pdf with unchanged inputs")
+
+        test_cases = [
+            ([title_page("מנהל"), driver_page("נהג", 2)], "test", "Should rebuild pdf when pages change"),
+            ([title_page("מנהל"), driver_page("נהג", 2)], "other", "Should rebuild pdf when title changes"),
+        ]
+
+        for pages, title, message in test_cases:
+            with self.subTest(message):
+                previous_build_time = path.getmtime(pdf_filepath)
+                self.assertNotEqual(build(pages, title), previous_build_time, message)
+
+    def test_build_single_bytes(self):
+        content = [{ key_prop: "משפחה", driver_prop: "נהג" }]
+
+        pdf_bytes = PDFBuilder("test", filepath=temp_pdf_filepath).build_single_bytes("כותרת", pdf_properties, content)
+        self.assertTrue(pdf_bytes.startswith(b"%PDF"), "Should return rendered pdf bytes")
+        self.assertFalse(path.exists(f"{temp_pdf_filepath}.pdf"), "Should not write pdf file by default")
+
+        PDFBuilder("test", filepath=temp_pdf_filepath).build_single_bytes("כותרת", pdf_properties, content, save=True)
+        self.assertTrue(path.exists(f"{temp_pdf_filepath}.pdf"), "Should write pdf file when saving")
+        self.assertTrue(path.exists(f"{temp_pdf_filepath}{pdf_hash_suffix}"), "Should write pdf hash when saving")
+
+    def test_missing_pdf_rebuilt(self):
+        pages = [driver_page("נהג")]
+        PDFBuilder("test", filepath=temp_pdf_filepath).build_multi(pages, pdf_properties)
+        remove(f"{temp_pdf_filepath}.pdf")
+
+        PDFBuilder("test", filepath=temp_pdf_filepath).build_multi(pages, pdf_properties)
+        self.assertTrue(path.exists(f"{temp_pdf_filepath}.pdf"), "Should rebuild missing pdf even if its hash exists")
@@ -0,0 +1,36 @@
+import json
+import pickle
+import unittest
+
+from src.data import key_prop, driver_prop
+from src.records import Record, get_schema, to_record, to_json_value
+
+class TestRecords(unittest.TestCase):
+    def test_record_access(self):
+        record = to_record((key_prop, driver_prop), ("משפחה", None))
+
+        self.assertEqual(record[key_prop], "משפחה", "Should access values by headers")
+        self.assertEqual(record.get("missing", "default"), "default", "Should return default for unknown headers")
+        self.assertIn(driver_prop, record, "Should contain headers with empty values")
+        self.assertEqual(dict(record), { key_prop: "משפחה", driver_prop: None }, "Should convert to dict in headers order")
+        self.assertEqual(record, { key_prop: "משפחה", driver_prop: None }, "Should equal dict of the same values")
+        self.assertEqual(list(record.values()), ["משפחה", None], "Should list values like a dict")
+        self.assertEqual(list(record.items()), [(key_prop, "משפחה"), (driver_prop, None)], "Should list items like a dict")
+        with self.assertRaises(KeyError):
+            record["missing"]
+
+    def test_record_compact(self):
+        first = to_record((key_prop, driver_prop), ("א", "ב"))
+        second = to_record([key_prop, driver_prop], ("ג", "ד"))
+
+        self.assertIs(first.schema, second.schema, "Should share schema of the same headers")
+        self.assertFalse(hasattr(first, "__dict__"), "Should not allocate attributes dict per record")
+
+    def test_record_serialization(self):
+        record = Record(get_schema((key_prop, driver_prop)), ("משפחה", "נהג"))
+
+        self.assertEqual(json.loads(json.dumps(record, default=to_json_value)), dict(record), "Should serialize as json object")
+        self.assertEqual(record.to_dict(), dict(record), "Should convert to dict of the same values")
+        unpickled = pickle.loads(pickle.dumps(record))
+        self.assertEqual(unpickled, record, "Should keep values when pickled")
+        self.assertIs(unpickled.schema, record.schema, "Should share schema when unpickled")
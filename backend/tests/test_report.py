@@ -1,14 +1,16 @@
 import unittest
 from os import path
+from threading import Event, Thread
 
-from src.data import date_prop, status_prop, key_prop, driver_prop_index
+from src.cache import files_cache
+from src.data import date_prop, status_prop, key_prop, street_prop, driver_prop_index
 from src.month import generate_month_files, get_report_path, get_reports_list, is_active_report, activate_report
-from src.report import get_no_driver_families, get_no_manager_drivers, search_report, search_report_column, update_family_receipt_status, update_driver_receipt_status, get_family_receipt_status, receipt_update_results, get_driver_receipt_status
+from src.report import get_no_driver_families, get_no_manager_drivers, search_report, search_report_page, search_report_column, get_report_completion_families, update_family_receipt_status, update_driver_receipt_status, get_family_receipt_status, receipt_update_results, get_driver_receipt_status
 from src.results import receipt_update_results
 
 from tests.families_util import Family, load_families, write_families, setUpFamilies, tearDownFamilies
 from tests.managers_util import write_managers, setUpManagers, tearDownManagers
-from tests.report_util import generate_report, tearDownMonth, remove_all_reports
+from tests.report_util import generate_report, load_report, tearDownMonth, remove_all_reports
 
 class TestReportValidation(unittest.TestCase):
     def setUpClass():
@@ -109,6 +111,24 @@ class TestReportGeneration(unittest.TestCase):
         self.assertTrue(file_exists,
                         "Should validate report file exists in the right path")
 
+    def test_report_released_once_written(self):
+        name = 'דוח משוחרר'
+        families_file = load_families()
+        error = generate_month_files(families_file, name)
+        self.assertTrue(error is None, "Failed generating month report")
+
+        loaded = Event()
+        def load_in_other_thread():
+            load_report(name)
+            files_cache.release_held()
+            loaded.set()
+
+        other_thread = Thread(target=load_in_other_thread)
+        other_thread.start()
+        other_thread.join(5)
+        files_cache.release_held()
+        self.assertTrue(loaded.is_set(), "Should not hold generated report after it is written")
+
     def test_report_lines_number(self):
         names = ["שלום", "פרינץ", "נתאי", "אביגל", "אפרת"]
         families = [Family({"שם מלא": family_name, "נהג": "נהגוס"}) for family_name in names]
@@ -274,6 +294,24 @@ class TestSearchReport(unittest.TestCase):
                 search_result = search_report(report_file, query, 'driver')
                 self.assertEqual(expected_len, len(search_result), message)
 
+    def test_search_page(self):
+        families = [Family({"שם מלא": name}) for name in ["פרינץ", "כהנא", "נתאי"]]
+        report_file = generate_report(self.assertTrue, families)
+
+        first_page = search_report_page(report_file, limit=2, with_total=True)
+        self.assertEqual([f[key_prop] for f in first_page.results], ["פרינץ", "כהנא"], "Should return first families of report")
+        self.assertEqual(first_page.total, 3, "Should count all report families")
+
+        second_page = search_report_page(report_file, limit=2, cursor=first_page.next_cursor)
+        self.assertEqual([f[key_prop] for f in second_page.results], ["נתאי"], "Should continue after cursor")
+        self.assertIsNone(second_page.next_cursor, "Should not return cursor on last page")
+        self.assertIsNone(second_page.results[0][status_prop], "Should return report receipt status")
+
+    def test_search_fields(self):
+        report_file = generate_report(self.assertTrue, [Family({"שם מלא": "פרינץ"})])
+        result = search_report(report_file, fields=[key_prop, status_prop])
+        self.assertEqual(result, [{ key_prop: "פרינץ", status_prop: None }], "Should return requested fields only")
+
     def test_search_no_value_cell(self):
         families = [Family({"שם מלא": "פרינץ", "נהג": None})]
         
@@ -366,6 +404,30 @@ class TestMarkReport(unittest.TestCase):
                 self.assertEqual(result[0][date_prop], expected_date, message)
                 self.assertEqual(result[0][status_prop], expected_status, message)
     
+    def test_read_only_receipt_status(self):
+        family_name, report_file = self.generate_report()
+        update_family_receipt_status(report_file, family_name, { "date": "2000-01-01", "status": True })
+
+        read_only_report = load_report("שם דוח", read_only=True)
+        result = search_report(read_only_report, family_name, 'name')
+        self.assertEqual(result[0][date_prop], "2000-01-01", "Should read updated date from read-only report")
+        self.assertEqual(result[0][status_prop], True, "Should read updated status style from read-only report")
+
+    def test_report_completion_families(self):
+        families = [
+            Family({ "שם מלא": "לא קיבל", "רחוב": "רחוב א" }),
+            Family({ "שם מלא": "ללא נהג", "רחוב": "רחוב ב", "נהג": "" }),
+            Family({ "שם מלא": "קיבל", "רחוב": "רחוב ג" }),
+        ]
+        report_file = generate_report(self.assertTrue, families)
+        update_family_receipt_status(report_file, "לא קיבל", { "date": "2000-01-01", "status": False })
+        update_family_receipt_status(report_file, "קיבל", { "date": "2000-01-01", "status": True })
+
+        completion_families = get_report_completion_families(report_file, load_families())
+        actual = [(family[key_prop], family[street_prop]) for family in completion_families]
+        expected = [("לא קיבל", "רחוב א"), ("ללא נהג", "רחוב ב")]
+        self.assertEqual(actual, expected, "Should return families who didn't receive with their street")
+
     def test_update_family_receipt_status_result(self):
         test_cases = [
             ({}, receipt_update_results["MISSING_DATE"], "Empty object should return missing date result"),
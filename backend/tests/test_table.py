@@ -0,0 +1,31 @@
+import unittest
+
+from src.table import build_table, and_masks
+
+headers = ["שם", "נהג"]
+
+class TestColumnsTable(unittest.TestCase):
+    def test_build_table(self):
+        test_cases = [
+            ([], [[], []], [], "Should build empty columns of no rows"),
+            ([("א", "ב"), ("ג", "ד")], [["א", "ג"], ["ב", "ד"]], [2, 3], "Should split rows to columns"),
+            ([("א",), ("ג", "ד", "ה")], [["א", "ג"], [None, "ד"]], [2, 3], "Should fill short rows and cut long rows"),
+        ]
+
+        for rows, expected_columns, expected_row_indexes, message in test_cases:
+            with self.subTest(message):
+                table = build_table(headers, rows, 2, len(headers))
+                self.assertEqual(table.columns, expected_columns, message)
+                self.assertEqual(table.row_indexes, expected_row_indexes, message)
+
+    def test_column_operations(self):
+        table = build_table(headers, [("א", "דוד"), ("ב", None), (None, "דוד"), ("ג", "משה"), ("ד", "דוד")], 2, len(headers))
+        has_name = table.has_value("שם")
+
+        self.assertEqual(table.column("חסר"), [None] * 5, "Should return empty values of missing column")
+        self.assertEqual(table.count(and_masks(has_name, table.is_empty("נהג"))), 1, "Should count rows of all masks")
+        self.assertEqual(table.values("שם", table.is_empty("נהג")), ["ב"], "Should return column values of mask")
+        self.assertEqual(
+            table.group_count("נהג", and_masks(has_name, table.has_value("נהג"))),
+            { "דוד": 2, "משה": 1 },
+            "Should count rows of each value in mask")
@@ -0,0 +1,105 @@
+import unittest
+from datetime import datetime
+from io import BytesIO
+from os import path, remove, utime
+from time import time
+from openpyxl import Workbook, load_workbook
+from openpyxl.packaging.custom import BoolProperty
+
+from src.styles import families_cell_style
+from src.xlsx import read_xlsx, read_xlsx_file, get_sidecar_path
+
+def to_xlsx(rows, styled_cells=[], custom_properties={}):
+    workbook = Workbook()
+    worksheet = workbook.active
+    for row in rows:
+        worksheet.append(row)
+    for row, column in styled_cells:
+        worksheet.cell(row=row, column=column).style = families_cell_style
+    for name, value in custom_properties.items():
+        workbook.custom_doc_props.append(BoolProperty(name, value))
+
+    file = BytesIO()
+    workbook.save(file)
+    return file.getvalue()
+
+temp_xlsx_filepath = "system_files/temp_xlsx.xlsx"
+
+def write_xlsx(rows, modified=None):
+    with open(temp_xlsx_filepath, 'wb') as file:
+        file.write(to_xlsx(rows))
+    if modified is not None:
+        utime(temp_xlsx_filepath, (modified, modified))
+
+def read_file_values(filename):
+    return list(read_xlsx_file(filename).iter_rows(values_only=True))
+
+def read_openpyxl_values(data):
+    worksheet = load_workbook(BytesIO(data), read_only=True).active
+    return list(worksheet.iter_rows(values_only=True))
+
+class TestXlsxReader(unittest.TestCase):
+    def test_same_values_as_openpyxl(self):
+        test_cases = [
+            ([["שם", "מספר"], ["פרינץ", 12], ["כהנא", 1.5]], "Should read strings and numbers"),
+            ([["שם", "תאריך"], ["פרינץ", datetime(2024, 2, 1)], [True, None]], "Should read dates and booleans"),
+            ([["שם", "נהג"], ["פרינץ"], [], ["כהנא", None, "ארז"]], "Should fill short and empty rows"),
+        ]
+
+        for rows, message in test_cases:
+            with self.subTest(message):
+                data = to_xlsx(rows)
+                self.assertEqual(list(read_xlsx(data).iter_rows(values_only=True)), read_openpyxl_values(data), message)
+
+    def test_named_styles(self):
+        sheet = read_xlsx(to_xlsx([["שם", "נהג"], ["פרינץ", "ארז"]], styled_cells=[(2, 2), (3, 1)]))
+        styles = [[cell.style for cell in row] for row in sheet.rows]
+        self.assertEqual(
+            styles,
+            [["Normal", "Normal"], ["Normal", families_cell_style.name], [families_cell_style.name, None]],
+            "Should read named styles of cells, and no style of missing cells")
+
+    def test_iter_rows(self):
+        sheet = read_xlsx(to_xlsx([["שם", "נהג"], ["פרינץ"], ["כהנא", "ארז"]]))
+
+        self.assertEqual((sheet.max_row, sheet.max_column), (3, 2), "Should read sheet dimensions")
+        self.assertEqual([cell.value for cell in next(sheet.rows)], ["שם", "נהג"], "Should start rows from first row")
+        self.assertEqual(
+            list(sheet.iter_rows(min_row=2, values_only=True)),
+            [("פרינץ", None), ("כהנא", "ארז")],
+            "Should return row values from min_row")
+
+    def test_custom_properties(self):
+        sheet = read_xlsx(to_xlsx([["שם"]], custom_properties={ "active": True, "other": False }))
+        self.assertEqual(sheet.custom_properties, { "active": True, "other": False }, "Should read boolean custom properties")
+
+class TestXlsxSidecar(unittest.TestCase):
+    def tearDown(self):
+        for filepath in [temp_xlsx_filepath, get_sidecar_path(temp_xlsx_filepath)]:
+            if path.exists(filepath):
+                remove(filepath)
+
+    def test_settled_file_sidecar_reused(self):
+        write_xlsx([["שם"], ["פרינץ"]], modified=time() - 60)
+        read_xlsx_file(temp_xlsx_filepath)
+        sidecar_time = path.getmtime(get_sidecar_path(temp_xlsx_filepath))
+
+        self.assertEqual(read_file_values(temp_xlsx_filepath), [("שם",), ("פרינץ",)], "Should load rows from sidecar")
+        self.assertEqual(path.getmtime(get_sidecar_path(temp_xlsx_filepath)), sidecar_time, "Should not check settled unchanged file again")
+
+    def test_stale_sidecar_rebuilt(self):
+        test_cases = [
+            (lambda: write_xlsx([["שם"], ["כהנא"]]), "Should rebuild sidecar when file changes"),
+            (lambda: write_xlsx([["שם"], ["כהנא"]], modified=time() - 60), "Should rebuild sidecar when file changes to an older time"),
+            (lambda: open(get_sidecar_path(temp_xlsx_filepath), 'wb').close(), "Should rebuild unreadable sidecar"),
+        ]
+
+        for change, message in test_cases:
+            with self.subTest(message):
+                write_xlsx([["שם"], ["פרינץ"]])
+                read_xlsx_file(temp_xlsx_filepath)
+
+                change()
+                with open(temp_xlsx_filepath, 'rb') as file:
+                    expected_values = read_openpyxl_values(file.read())
+                self.assertEqual(read_file_values(temp_xlsx_filepath), expected_values, message)